@@ -1,11 +1,17 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from datetime import datetime, timedelta
-from bcb import sgs, Expectativas
+import numpy as np
+from datetime import timedelta
 import time
 
+from obinvest import (
+    CHART_SERIES, COMP_ANOS, COMP_PARAMS, C_ACCENT, C_DOLAR, C_IGPM, C_INPUT_BG, C_IPCA, C_MAIN, C_PIB,
+    C_REAL, C_SELIC, C_SIDEBAR, C_TEXT_MAIN, C_TEXT_SIDE, EXPORT_FORMATOS, FOCUS_INDICADORES, HIST_ANOS,
+    MC_PATHS, METRICS, METRICS_PORT, SERIES, build_chart, build_focus_chart, build_series_chart,
+    comparison_grid, export_bytes, export_ext, export_history, fmt_idade, get_backtest, get_monte_carlo,
+    get_monthly_table, get_refresher, plan_balances, request_series, taxa_anual, timed,
+)
+
 # ==============================================================================
 # 1. SETUP E ESTILIZAÇÃO
 # ==============================================================================
@@ -15,22 +21,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Paleta de Cores
-C_SIDEBAR = "#0F172A"
-C_MAIN = "#F8FAFC"
-C_ACCENT = "#F97316"
-C_TEXT_MAIN = "#1E293B"
-C_TEXT_SIDE = "#FFFFFF"
-C_INPUT_BG = "#1E293B"
-
-# Cores dos Indicadores
-C_SELIC = "#334155"
-C_IPCA = "#D97706"
-C_REAL = "#059669"
-C_DOLAR = "#0EA5E9"
-C_IGPM = "#8B5CF6"
-C_PIB = "#EAB308"
-
 st.markdown(f"""
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
@@ -177,120 +167,10 @@ st.markdown(f"""
 </style>
 """, unsafe_allow_html=True)
 
-# ==============================================================================
-# 2. DADOS E FUNÇÕES DE BUSCA
-# ==============================================================================
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def get_data():
-    """
-    Busca dados históricos do SGS (Série Histórica/Passado).
-    """
-    for attempt in range(3):
-        try:
-            hoje = datetime.today()
-            start = (hoje - timedelta(days=365*10)).strftime("%Y-%m-%d")
-            
-            # CÓDIGOS SGS:
-            # 4380: PIB Mensal (R$ Milhões) - Série oficial de valores correntes
-            codigos = {
-                "Selic": 432, 
-                "IPCA": 13522, 
-                "IGPM": 13521, 
-                "Dolar": 1, 
-                "PIB_Mensal_Raw": 4380 
-            }
-            df = sgs.get(codigos, start=start).ffill().dropna()
-            
-            # Calcula o PIB Acumulado 12 Meses para o GRÁFICO
-            if not df.empty and "PIB_Mensal_Raw" in df.columns:
-                df["PIB_12M"] = df["PIB_Mensal_Raw"].rolling(window=12).sum()
-            
-            if not df.empty: return df
-        except Exception:
-            time.sleep(1)
-            continue
-    return pd.DataFrame()
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def get_focus_data():
-    """
-    Busca a projeção do FOCUS para o PIB Total do ano corrente.
-    Filtra direto na API para evitar timeout.
-    """
-    res = {"IPCA": 0.0, "PIB": 0.0, "Data_PIB": "-", "Ref_Year": datetime.now().year}
-    
-    try:
-        em = Expectativas()
-        
-        # Datas
-        hoje = datetime.now()
-        dt_lim = (hoje - timedelta(days=30)).strftime('%Y-%m-%d') # 30 dias é suficiente
-        ano_atual = hoje.year 
-        
-        # 1. IPCA (ExpectativasMercadoInflacao12Meses)
-        ep_ipca = em.get_endpoint('ExpectativasMercadoInflacao12Meses')
-        df_ipca = (ep_ipca.query()
-                   .filter(ep_ipca.Data >= dt_lim)
-                   .filter(ep_ipca.Suavizada == 'S')
-                   .filter(ep_ipca.baseCalculo == 0)
-                   .collect())
-                   
-        if not df_ipca.empty:
-            # Pega o último registro disponível ordenado por data
-            df_ipca = df_ipca.sort_values('Data', ascending=True)
-            res["IPCA"] = float(df_ipca.iloc[-1]['Mediana'])
-
-        # 2. PIB (ExpectativasMercadoAnuais -> PIB Total)
-        ep_anual = em.get_endpoint('ExpectativasMercadoAnuais')
-        
-        # Filtra direto no servidor: Indicador 'PIB Total'
-        df_pib = (ep_anual.query()
-                  .filter(ep_anual.Indicador == 'PIB Total')
-                  .filter(ep_anual.Data >= dt_lim)
-                  .collect())
-
-        if not df_pib.empty:
-            # Garante que DataReferencia seja inteiro
-            df_pib['DataReferencia'] = pd.to_numeric(df_pib['DataReferencia'], errors='coerce')
-            df_pib = df_pib.dropna(subset=['DataReferencia'])
-            df_pib['DataReferencia'] = df_pib['DataReferencia'].astype(int)
-            
-            # Tenta pegar o ano atual
-            df_foco = df_pib[df_pib['DataReferencia'] == ano_atual]
-            
-            # Se não tiver dados para o ano atual, tenta o próximo
-            if df_foco.empty:
-                df_foco = df_pib[df_pib['DataReferencia'] == ano_atual + 1]
-                ano_atual = ano_atual + 1 # Atualiza a referência
-            
-            if not df_foco.empty:
-                # Pega a publicação mais recente (Data de publicação)
-                ultimo = df_foco.sort_values('Data', ascending=False).iloc[0]
-                
-                res["PIB"] = float(ultimo['Mediana'])
-                res["Data_PIB"] = pd.to_datetime(ultimo['Data']).strftime('%d/%m')
-                res["Ref_Year"] = int(ultimo['DataReferencia'])
-
-        return res
-
-    except Exception as e:
-        print(f"Erro Focus: {e}")
-        return res
-
-with st.spinner('Atualizando Indicadores...'):
-    df = get_data() # Dados históricos
-    focus = get_focus_data() # Dados de projeção
-    
-    ipca_proj = focus["IPCA"]
-    pib_proj = focus["PIB"] # <--- PROJEÇÃO DO FOCUS
-    data_ref_pib = focus["Data_PIB"]
-    ref_year_pib = focus["Ref_Year"]
-    has_focus_pib = data_ref_pib != "-"
+_t_pagina = time.perf_counter()
 
-if df.empty: 
-    st.error("Erro na conexão com Banco Central (SGS). Tente recarregar.")
-    st.stop()
+# Páginas que não usam dados: não importam bcb/plotly nem esperam pelo snapshot
+PAGINAS_ESTATICAS = {"Glossário"}
 
 # SIDEBAR
 with st.sidebar:
@@ -300,7 +180,32 @@ with st.sidebar:
         st.markdown(f"<div style='color:{C_ACCENT}; font-weight:800; font-size:2rem; text-align:center;'>OBINVEST</div>", unsafe_allow_html=True)
     nav = st.radio("Navegação", ["Dados Macroeconômicos", "Calculadora de Rentabilidade", "Glossário"], label_visibility="collapsed")
     st.markdown("<div style='margin-top:20px; border-top:1px solid #1E293B'></div>", unsafe_allow_html=True)
-    st.caption(f"Atualizado: {datetime.now().strftime('%d/%m/%Y')}")
+
+# Página oculta de diagnóstico (métricas do processo): ?diag=1 na URL
+if st.query_params.get("diag"): nav = "Diagnóstico"
+
+if nav not in PAGINAS_ESTATICAS:
+    refresher = get_refresher()
+    if not refresher.ready.is_set():
+        # Primeira execução sem histórico em disco: único caso em que a página espera o BCB
+        with st.spinner('Atualizando Indicadores...'):
+            refresher.ready.wait(timeout=120)
+
+    snap = refresher.snapshot
+    if snap is None: 
+        st.error("Erro na conexão com Banco Central (SGS). Tente recarregar.")
+        st.stop()
+
+    ds = snap["ds"] # Dados históricos, uma série por indicador (somente leitura, compartilhados entre sessões)
+    focus = snap["focus"] # Dados de projeção
+
+    ipca_proj = focus["IPCA"]
+    pib_proj = focus["PIB"] # <--- PROJEÇÃO DO FOCUS
+    data_ref_pib = focus["Data_PIB"]
+    ref_year_pib = focus["Ref_Year"]
+    has_focus_pib = data_ref_pib != "-"
+
+    st.sidebar.caption(f"Atualizado {fmt_idade(snap['fetched_at'])} ({snap['fetched_at'].strftime('%d/%m/%Y %H:%M')})")
 
 if 'last_nav' not in st.session_state: st.session_state.last_nav = nav
 if nav != st.session_state.last_nav:
@@ -317,13 +222,14 @@ if nav == "Dados Macroeconômicos":
 
     if 'selected_chart' not in st.session_state: st.session_state.selected_chart = "Geral"
 
-    latest = df.iloc[-1]
-    previous = df.iloc[-2] if len(df) > 1 else latest
-    ref_date = latest.name.strftime('%d/%m')
+    # Último e penúltimo valor de cada série, na frequência dela
+    latest = {n: float(ds[n].iloc[-1]) for n in ["Selic", "IPCA", "Dolar", "IGPM"]}
+    previous = {n: float(ds[n].iloc[-2]) if len(ds[n]) > 1 else latest[n] for n in latest}
+    ref_date = ds["Selic"].index[-1].strftime('%d/%m')
     
     v_selic = latest["Selic"]
     v_ipca = latest["IPCA"]
-    v_real = ((1 + v_selic/100) / (1 + v_ipca/100) - 1) * 100
+    v_real = float(ds["Juro_Real"].iloc[-1])
     v_dolar = latest["Dolar"]
     v_igpm = latest["IGPM"]
     
@@ -380,122 +286,106 @@ if nav == "Dados Macroeconômicos":
         "PIB": "Evolução Histórica do PIB (Valores Correntes Acumulados 12M)"
     }
     
+    chart_series = CHART_SERIES.get(chart_type, [chart_type])
+    d_min = min(ds[n].index.min() for n in chart_series).date()
+    d_max = max(ds[n].index.max() for n in chart_series).date()
+    
     c_head_1, c_head_2 = st.columns([3, 1])
     with c_head_1:
         st.markdown(f"### {titles.get(chart_type, 'Gráfico')}")
     
-    df_chart = pd.DataFrame()
     with c_head_2:
         with st.expander("Filtrar Período", expanded=False):
-            d_max = df.index.max().date()
-            d_ini = st.date_input("Início", d_max - timedelta(days=730 if chart_type != "PIB" else 365*5), min_value=df.index.min().date(), max_value=d_max, format="DD/MM/YYYY")
-            d_fim = st.date_input("Fim", d_max, min_value=df.index.min().date(), max_value=d_max, format="DD/MM/YYYY")
+            d_ini = st.date_input("Início", max(d_min, d_max - timedelta(days=730 if chart_type != "PIB" else 365*5)), min_value=d_min, max_value=d_max, format="DD/MM/YYYY")
+            d_fim = st.date_input("Fim", d_max, min_value=d_min, max_value=d_max, format="DD/MM/YYYY")
     
-    df_chart = df.loc[(df.index.date >= d_ini) & (df.index.date <= d_fim)]
-
-    # RENDERIZAÇÃO
-    if df_chart.empty: 
+    # RENDERIZAÇÃO (figura reaproveitada enquanto dados, gráfico e período forem os mesmos)
+    fig = build_chart(snap["version"], chart_type, d_ini, d_fim, ds)
+    if fig is None: 
         st.warning("Nenhum dado encontrado para o período.")
     else:
-        fig = go.Figure()
-        
-        if chart_type == "Geral":
-            fig = make_subplots(specs=[[{"secondary_y": False}]])
-            fig.add_trace(go.Scatter(x=df_chart.index, y=df_chart["Selic"], name="Selic", line=dict(color=C_SELIC, width=3)))
-            fig.add_trace(go.Scatter(x=df_chart.index, y=df_chart["IPCA"], name="IPCA", line=dict(color=C_ACCENT, width=3)))
-            fig.update_yaxes(title_text="Taxa (%)", ticksuffix="%")
-        elif chart_type == "Selic": 
-            fig.add_trace(go.Scatter(x=df_chart.index, y=df_chart["Selic"], name="Selic", line=dict(color=C_SELIC, width=4)))
-            fig.update_yaxes(ticksuffix="%")
-        elif chart_type == "IPCA": 
-            fig.add_trace(go.Scatter(x=df_chart.index, y=df_chart["IPCA"], name="IPCA", line=dict(color=C_IPCA, width=4)))
-            fig.update_yaxes(ticksuffix="%")
-        elif chart_type == "Juro Real": 
-            df_chart["Real_Calc"] = ((1 + df_chart["Selic"]/100) / (1 + df_chart["IPCA"]/100) - 1) * 100
-            fig.add_trace(go.Scatter(x=df_chart.index, y=df_chart["Real_Calc"], name="Juro Real", line=dict(color=C_REAL, width=3)))
-            fig.update_yaxes(ticksuffix="%")
-        elif chart_type == "Dolar": 
-            fig.add_trace(go.Scatter(x=df_chart.index, y=df_chart["Dolar"], name="Dólar", fill='tozeroy', line=dict(color=C_DOLAR, width=2)))
-            fig.update_yaxes(tickprefix="R$ ")
-        elif chart_type == "IGPM": 
-            fig.add_trace(go.Scatter(x=df_chart.index, y=df_chart["IGPM"], name="IGP-M", fill='tozeroy', line=dict(color=C_IGPM, width=2)))
-            fig.update_yaxes(ticksuffix="%", autorange=True)
-            
-        elif chart_type == "PIB":
-            # ==========================================
-            # GRÁFICO: APENAS HISTÓRICO (ACUMULADO 12M)
-            # ==========================================
-            try:
-                # Usa a coluna calculada PIB_12M (R$ Milhões) e converte para Trilhões
-                df_pib = df_chart["PIB_12M"].dropna() / 1_000_000
-                
-                if not df_pib.empty:
-                    fig.add_trace(go.Scatter(
-                        x=df_pib.index, 
-                        y=df_pib, 
-                        name="PIB (12 Meses)", 
-                        fill='tozeroy', 
-                        line=dict(color=C_PIB, width=3)
-                    ))
-
-                    fig.update_layout(
-                        showlegend=False, 
-                        yaxis=dict(title="PIB Nominal (R$ Trilhões)", tickprefix="R$ ", showgrid=True),
-                        xaxis=dict(title="Mês de Referência"),
-                        hovermode="x unified"
-                    )
-                    
-                    st.plotly_chart(fig, use_container_width=True)
-                    
-                    st.markdown(f"""
-                    <div class="dynamic-legend">
-                        <b>Histórico Oficial:</b><br>
-                        O gráfico exibe a evolução do PIB Nominal acumulado em 12 meses (valores correntes).<br>
-                        Fonte: Banco Central do Brasil (Série SGS 4380 consolidada).
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.warning("Período selecionado insuficiente para cálculo do acumulado de 12 meses.")
-                    
-            except Exception as e:
-                st.error(f"Erro ao gerar gráfico do PIB: {e}")
-        
-        if chart_type != "PIB":
-            fig.update_layout(template="plotly_white", height=350, margin=dict(t=30, l=10, r=10, b=10), hovermode="x unified", xaxis=dict(showgrid=False), yaxis=dict(showgrid=True, gridcolor="#E2E8F0"))
-            st.plotly_chart(fig, use_container_width=True)
+        with timed("render_chart", chart=chart_type): st.plotly_chart(fig, use_container_width=True)
+        if chart_type == "PIB":
+            st.markdown(f"""
+            <div class="dynamic-legend">
+                <b>Histórico Oficial:</b><br>
+                O gráfico exibe a evolução do PIB Nominal acumulado em 12 meses (valores correntes).<br>
+                Fonte: Banco Central do Brasil (Série SGS 4380 consolidada).
+            </div>
+            """, unsafe_allow_html=True)
+
+    # OUTROS INDICADORES: séries do registro fora do snapshot, buscadas só quando escolhidas
+    extras = [n for n, cfg in SERIES.items() if not cfg.get("base")]
+    st.markdown("---")
+    c1, c_ser = st.columns([5, 2])
+    with c1: st.markdown("### Outros Indicadores")
+    with c_ser: extra = st.selectbox("Indicador", extras, index=None, format_func=lambda n: SERIES[n]["rotulo"], placeholder="Escolha um indicador", key="extra_serie", label_visibility="collapsed")
+    if extra is not None:
+        # A busca roda numa thread; enquanto não termina, só este trecho da página é refeito a cada segundo
+        pendente = not request_series(extra, snap["version"]).done()
+        @st.fragment(run_every=1.0 if pendente else None)
+        def outros_indicadores():
+            job = request_series(extra, snap["version"])
+            if not job.done(): st.info(f"Buscando {SERIES[extra]['rotulo']} no Banco Central..."); return
+            if pendente: st.rerun() # Terminou: página inteira de novo, sem a atualização periódica
+            if job.exception() is not None: st.warning("Série indisponível no momento. Tente de novo em instantes."); return
+            fig_x = build_series_chart(snap["version"], extra, job.result())
+            with timed("render_chart", chart="extra"): st.plotly_chart(fig_x, use_container_width=True)
+            st.caption(f"Fonte: Banco Central do Brasil (SGS {SERIES[extra]['codigo']}), {SERIES[extra]['unidade']}.")
+        outros_indicadores()
 
     # TABLE
     if 'table_page' not in st.session_state: st.session_state.table_page = 0
-    df_rev = df.resample('M').last().sort_index(ascending=False)
-    for c in ["Selic", "IPCA", "Dolar", "IGPM"]: df_rev[f"{c}_D"] = df_rev[c].diff(-1)
-    
-    ITENS = 6
-    start = st.session_state.table_page * ITENS
-    end = start + ITENS
-    if start >= len(df_rev) and len(df_rev) > 0: st.session_state.table_page = 0; start = 0; end = ITENS
-    df_view = df_rev.iloc[start:end].copy()
+    df_show, df_css = get_monthly_table(snap["version"], ds)
+    n_meses = len(df_show)
 
     st.markdown("---")
-    c1, c2, c3 = st.columns([6, 1, 1])
+    c1, c_itens, c2, c3 = st.columns([5, 1, 1, 1])
     with c1: st.markdown(f"### Dados Detalhados")
+    with c_itens: ITENS = st.selectbox("Linhas", [6, 12, 24, 60, "Todas"], key="table_itens", label_visibility="collapsed")
+    ITENS = n_meses if ITENS == "Todas" else ITENS
+    start = st.session_state.table_page * ITENS
+    end = start + ITENS
+    if start >= n_meses and n_meses > 0: st.session_state.table_page = 0; start = 0; end = ITENS
     with c2: 
         if st.button("◀", key="p", disabled=(st.session_state.table_page == 0), use_container_width=True): st.session_state.table_page -= 1; st.rerun()
     with c3: 
-        if st.button("▶", key="n", disabled=(end >= len(df_rev)), use_container_width=True): st.session_state.table_page += 1; st.rerun()
-
-    def color_arrows(val): return "color: #10B981; font-weight:600" if "▲" in val else "color: #EF4444; font-weight:600" if "▼" in val else "color: #64748B"
-    for c in ["Selic", "IPCA", "IGPM", "Dolar"]:
-        df_view[f"{c}_Show"] = [f"{'R$' if c=='Dolar' else ''} {row[c]:.4f}{'%' if c!='Dolar' else ''} {'▲' if row[f'{c}_D']>0 else '▼' if row[f'{c}_D']<0 else '='}" for _, row in df_view.iterrows()]
-    st.dataframe(df_view[[f"{c}_Show" for c in ["Selic", "IPCA", "Dolar", "IGPM"]]].rename(columns={f"{c}_Show":c for c in ["Selic", "IPCA", "Dolar", "IGPM"]}).style.applymap(color_arrows), use_container_width=True, height=280)
+        if st.button("▶", key="n", disabled=(end >= n_meses), use_container_width=True): st.session_state.table_page += 1; st.rerun()
+
+    # Estilos já calculados: um único apply para a página inteira
+    css_view = df_css.iloc[start:end]
+    with timed("render_table"): st.dataframe(df_show.iloc[start:end].style.apply(lambda _: css_view, axis=None), use_container_width=True, height=280 if ITENS <= 6 else 560)
+
+    # EXPORTAÇÃO: o arquivo só é gerado (uma vez por versão e formato) quando alguém clica em Baixar
+    with st.expander("Exportar histórico completo"):
+        c_fmt, c_btn = st.columns([3, 1])
+        with c_fmt: fmt_hist = st.radio("Formato", list(EXPORT_FORMATOS), horizontal=True, key="export_fmt_hist", label_visibility="collapsed")
+        def baixar_historico(versao=snap["version"], fmt=fmt_hist, dados=ds):
+            with open(export_history(versao, fmt, dados), "rb") as f: return f.read()
+        ext, mime = export_ext([None, None], fmt_hist)
+        with c_btn: st.download_button("Baixar", data=baixar_historico, file_name=f"obinvest_historico.{ext}", mime=mime, key="export_hist", use_container_width=True)
+        st.caption("Todas as séries desde o início do histórico: diárias e mensais como publicadas pelo BCB, indicadores derivados e fechamento mensal. "
+                   "CSV e Parquet vêm num .zip, um arquivo por tabela.")
+
+    # EVOLUÇÃO DAS EXPECTATIVAS: arquivo local das publicações do Focus
+    st.markdown("---")
+    c1, c_ind = st.columns([5, 2])
+    with c1: st.markdown("### Evolução das Expectativas (Focus)")
+    with c_ind: ind_focus = st.selectbox("Indicador", FOCUS_INDICADORES, key="focus_ind", label_visibility="collapsed")
+    fig_f = build_focus_chart(refresher.focus_version, ind_focus) if refresher.focus_version else None
+    if fig_f is None: st.info("Histórico do Focus em carga: o gráfico aparece na próxima atualização da página.")
+    else:
+        with timed("render_chart", chart="focus"): st.plotly_chart(fig_f, use_container_width=True)
+        st.caption("Mediana das projeções de mercado para cada ano de referência, em cada publicação do Focus.")
 
 elif nav == "Calculadora de Rentabilidade":
+    import plotly.graph_objects as go
     st.markdown("<h1>Calculadora de Rentabilidade</h1>", unsafe_allow_html=True)
-    st.markdown("<p class='section-caption'>Projeção baseada na média histórica dos últimos 5 anos.</p>", unsafe_allow_html=True)
+    st.markdown("<p class='section-caption'>Projeção pela média histórica dos últimos 5 anos, simulação de Monte Carlo ou backtest sobre o histórico.</p>", unsafe_allow_html=True)
     
-    data_corte = df.index.max() - timedelta(days=365*5)
-    df_5y = df[df.index >= data_corte]
-    media_selic_5y = df_5y["Selic"].mean()
-    media_ipca_5y = df_5y["IPCA"].mean()
+    data_corte = ds["Selic"].index.max() - timedelta(days=365*5)
+    media_selic_5y = float(ds["Selic"][ds["Selic"].index >= data_corte].mean())
+    media_ipca_5y = float(ds["IPCA"][ds["IPCA"].index >= data_corte].mean())
 
     col_in, col_out = st.columns([1, 2])
     with col_in:
@@ -506,6 +396,8 @@ elif nav == "Calculadora de Rentabilidade":
         st.markdown("#### Indexador")
         tipo = st.selectbox("Escolha", ["Pós-fixado (CDI)", "IPCA +", "Pré-fixado"], label_visibility="collapsed")
         
+        # Taxas padrão dos indexadores não escolhidos (usadas no comparativo do Monte Carlo)
+        pct, fx, pre = 100.0, 6.0, 12.0
         if tipo == "Pós-fixado (CDI)":
             pct = st.number_input("Rentabilidade (% do CDI)", 0.0, 200.0, 100.0)
             taxa = media_selic_5y * (pct/100)
@@ -515,31 +407,133 @@ elif nav == "Calculadora de Rentabilidade":
             taxa = ((1 + media_ipca_5y/100) * (1 + fx/100) - 1) * 100
             msg = f"Base: IPCA médio 5 anos ({media_ipca_5y:.2f}%) + Taxa fixa."
         else:
-            taxa = st.number_input("Taxa Pré-fixada (% a.a.)", 0.0, 30.0, 12.0)
+            taxa = pre = st.number_input("Taxa Pré-fixada (% a.a.)", 0.0, 30.0, 12.0)
             msg = "Taxa fixa contratada."
         st.markdown(f"<div style='margin-top:10px; font-size:0.85rem; color:#64748B; border-top:1px solid #E2E8F0; padding-top:10px;'>ℹ️ Taxa Efetiva: <b>{taxa:.2f}% a.a.</b><br>{msg}</div>", unsafe_allow_html=True)
+        st.markdown("#### Projeção")
+        modo = st.radio("Projeção", ["Média 5 anos", "Monte Carlo", "Backtest histórico", "Comparativo"], horizontal=True, label_visibility="collapsed")
 
     periods = anos * 12
-    r_mensal = (1 + taxa/100)**(1/12) - 1
-    bal = ini; inv = ini; evol = [ini]
-    for _ in range(periods): 
-        bal = bal * (1 + r_mensal) + mes
-        inv += mes
-        evol.append(bal)
-        
-    with col_out:
-        st.markdown("#### Resultado Projetado")
-        r1, r2, r3 = st.columns(3)
-        def r_card(c, l, v, cl): c.markdown(f"<div style='background-color:white; padding:15px; border-radius:8px; border:1px solid #E2E8F0; text-align:center;'><div style='font-size:0.8rem; color:#64748B; font-weight:bold; margin-bottom:5px;'>{l}</div><div style='font-size:1.4rem; color:{cl}; font-weight:800;'>{v}</div></div>", unsafe_allow_html=True)
-        r_card(r1, "TOTAL INVESTIDO", f"R$ {inv:,.2f}", "#334155")
-        r_card(r2, "SALDO BRUTO", f"R$ {bal:,.2f}", C_ACCENT)
-        r_card(r3, "RENDIMENTO", f"R$ {bal-inv:,.2f}", C_REAL)
-        st.markdown("###")
-        fig_s = go.Figure()
-        fig_s.add_trace(go.Scatter(y=evol, x=list(range(len(evol))), fill='tozeroy', line=dict(color=C_ACCENT, width=3), name="Patrimônio Total"))
-        fig_s.add_trace(go.Scatter(y=[ini + (mes * i) for i in range(len(evol))], x=list(range(len(evol))), line=dict(color="#94A3B8", width=2, dash='dash'), name="Aporte Acumulado"))
-        fig_s.update_layout(template="plotly_white", height=350, margin=dict(t=20,l=0,r=0,b=0), xaxis=dict(showgrid=False, title="Meses"), yaxis=dict(showgrid=True, gridcolor="#E2E8F0", tickprefix="R$ "), legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
-        st.plotly_chart(fig_s, use_container_width=True)
+    def r_card(c, l, v, cl): c.markdown(f"<div style='background-color:white; padding:15px; border-radius:8px; border:1px solid #E2E8F0; text-align:center;'><div style='font-size:0.8rem; color:#64748B; font-weight:bold; margin-bottom:5px;'>{l}</div><div style='font-size:1.4rem; color:{cl}; font-weight:800;'>{v}</div></div>", unsafe_allow_html=True)
+    layout_calc = dict(template="plotly_white", height=350, margin=dict(t=20,l=0,r=0,b=0), xaxis=dict(showgrid=False, title="Meses"), yaxis=dict(showgrid=True, gridcolor="#E2E8F0", tickprefix="R$ "), legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+
+    proj = {} # Tabelas da projeção exibida, para exportar ({aba: DataFrame})
+    if modo == "Média 5 anos":
+        evol = plan_balances(taxa, ini, mes, np.arange(periods + 1))[0]
+        bal, inv = evol[-1], ini + mes * periods
+        proj["Projeção"] = pd.DataFrame({"Patrimônio": evol, "Aportado": ini + mes * np.arange(periods + 1)}, index=pd.RangeIndex(periods + 1, name="Mês"))
+
+        with col_out:
+            st.markdown("#### Resultado Projetado")
+            r1, r2, r3 = st.columns(3)
+            r_card(r1, "TOTAL INVESTIDO", f"R$ {inv:,.2f}", "#334155")
+            r_card(r2, "SALDO BRUTO", f"R$ {bal:,.2f}", C_ACCENT)
+            r_card(r3, "RENDIMENTO", f"R$ {bal-inv:,.2f}", C_REAL)
+            st.markdown("###")
+            fig_s = go.Figure()
+            fig_s.add_trace(go.Scatter(y=evol, x=list(range(len(evol))), fill='tozeroy', line=dict(color=C_ACCENT, width=3), name="Patrimônio Total"))
+            fig_s.add_trace(go.Scatter(y=[ini + (mes * i) for i in range(len(evol))], x=list(range(len(evol))), line=dict(color="#94A3B8", width=2, dash='dash'), name="Aporte Acumulado"))
+            fig_s.update_layout(**layout_calc)
+            st.plotly_chart(fig_s, use_container_width=True)
+
+    elif modo == "Backtest histórico":
+        # BACKTEST: o mesmo plano aplicado a cada mês de início do histórico, com Selic/IPCA realizados
+        bt = get_backtest(snap["version"], ds, ini, mes, anos, pct, fx, pre)
+        chave = {"Pós-fixado (CDI)": "CDI", "IPCA +": "IPCA", "Pré-fixado": "Pré"}[tipo]
+        inv = ini + mes * periods
+
+        with col_out:
+            if bt.empty:
+                st.warning(f"O histórico carregado ({HIST_ANOS} anos) não cobre um plano de {anos} anos. Reduza o prazo.")
+            else:
+                finais = bt[chave]
+                proj["Backtest"] = bt.rename_axis("Mês de início")
+                st.markdown(f"#### Resultado Histórico ({len(finais)} meses de início)")
+                r1, r2, r3 = st.columns(3)
+                r_card(r1, f"PIOR ({finais.idxmin().strftime('%m/%Y')})", f"R$ {finais.min():,.2f}", "#EF4444")
+                r_card(r2, "MEDIANA", f"R$ {finais.median():,.2f}", C_ACCENT)
+                r_card(r3, f"MELHOR ({finais.idxmax().strftime('%m/%Y')})", f"R$ {finais.max():,.2f}", C_REAL)
+                st.markdown("###")
+                fig_s = go.Figure()
+                fig_s.add_trace(go.Scatter(x=finais.index, y=finais, fill='tozeroy', line=dict(color=C_ACCENT, width=3), name="Saldo Final"))
+                fig_s.add_hline(y=inv, line=dict(color="#94A3B8", width=2, dash='dash'), annotation_text="Total Investido")
+                fig_s.update_layout(hovermode="x unified", **layout_calc)
+                fig_s.update_xaxes(title="Mês de Início")
+                st.plotly_chart(fig_s, use_container_width=True)
+                st.caption(f"Total investido: R$ {inv:,.2f}. Cada ponto é o saldo ao fim de {anos} ano(s) começando naquele mês.")
+
+    elif modo == "Comparativo":
+        # COMPARATIVO: grade produto x parâmetro x prazo (1 a 30 anos) sobre Selic/IPCA médios de 5 anos
+        chave = {"Pós-fixado (CDI)": "CDI", "IPCA +": "IPCA", "Pré-fixado": "Pré"}[tipo]
+        atuais = {"CDI": pct, "IPCA": fx, "Pré": pre}
+        cores = {"CDI": C_SELIC, "IPCA": C_IPCA, "Pré": C_ACCENT}
+
+        with col_out:
+            st.markdown("#### Comparativo de Produtos")
+            ir = st.toggle("Descontar IR (tabela regressiva por prazo de cada aporte)", value=True)
+            grade = comparison_grid(media_selic_5y, media_ipca_5y, ini, mes, ir)
+            finais = {k: float(plan_balances(taxa_anual(k, v, media_selic_5y, media_ipca_5y), ini, mes, [periods], ir)[0, 0]) for k, v in atuais.items()}
+            inv = ini + mes * periods
+            proj = {k: grade[k].set_axis(pd.Index(COMP_PARAMS[k][1], name=COMP_PARAMS[k][0])).set_axis([f"{a} anos" for a in COMP_ANOS], axis=1) for k in grade}
+            r1, r2, r3 = st.columns(3)
+            for c, k, l in [(r1, "CDI", f"{pct:.0f}% DO CDI"), (r2, "IPCA", f"IPCA + {fx:.2f}%"), (r3, "Pré", f"PRÉ {pre:.2f}%")]:
+                r_card(c, f"{l} ({anos} ANOS)", f"R$ {finais[k]:,.2f}", cores[k])
+            st.markdown("###")
+
+            rotulo, params = COMP_PARAMS[chave]
+            fig_h = go.Figure(go.Heatmap(
+                z=grade[chave].to_numpy(), x=COMP_ANOS, y=params, colorscale="Blues", colorbar=dict(tickprefix="R$ "),
+                hovertemplate=f"{rotulo}: %{{y}}<br>Prazo: %{{x}} ano(s)<br>Saldo: R$ %{{z:,.2f}}<extra></extra>",
+            ))
+            fig_h.add_vline(x=anos, line=dict(color="#334155", width=1, dash="dot"))
+            fig_h.update_layout(template="plotly_white", height=380, margin=dict(t=20, l=0, r=0, b=0), xaxis=dict(title="Prazo (anos)"), yaxis=dict(title=rotulo))
+            st.plotly_chart(fig_h, use_container_width=True)
+
+            fig_s = go.Figure()
+            for k, v in atuais.items():
+                y = plan_balances(taxa_anual(k, v, media_selic_5y, media_ipca_5y), ini, mes, COMP_ANOS * 12, ir)[0]
+                fig_s.add_trace(go.Scatter(x=COMP_ANOS, y=y, line=dict(color=cores[k], width=3), name=f"{COMP_PARAMS[k][0]} {v:g}"))
+            fig_s.add_trace(go.Scatter(x=COMP_ANOS, y=ini + mes * COMP_ANOS * 12, line=dict(color="#94A3B8", width=2, dash='dash'), name="Aporte Acumulado"))
+            fig_s.update_layout(hovermode="x unified", **layout_calc)
+            fig_s.update_xaxes(title="Anos")
+            st.plotly_chart(fig_s, use_container_width=True)
+            st.caption(f"Total investido em {anos} ano(s): R$ {inv:,.2f}. Base: Selic média 5 anos ({media_selic_5y:.2f}%) e IPCA médio 5 anos ({media_ipca_5y:.2f}%)."
+                       + (" Saldos líquidos de IR: 22,5% até 180 dias, 20% até 360, 17,5% até 720 e 15% acima, sobre o rendimento de cada aporte." if ir else " Saldos brutos."))
+
+    else:
+        # MONTE CARLO: trajetórias de Selic/IPCA sorteadas do histórico mensal do SGS
+        meses, fan = get_monte_carlo(snap["version"], ds, ini, mes, anos, pct, fx, pre)
+        chave = {"Pós-fixado (CDI)": "CDI", "IPCA +": "IPCA", "Pré-fixado": "Pré"}[tipo]
+        p5, p50, p95 = fan[chave]
+        inv = ini + mes * periods
+        proj = {k: pd.DataFrame(v.T, index=pd.Index(meses, name="Mês"), columns=["P5", "P50", "P95"]) for k, v in fan.items()}
+
+        with col_out:
+            st.markdown(f"#### Resultado Simulado ({MC_PATHS:,} cenários)".replace(",", "."))
+            r1, r2, r3 = st.columns(3)
+            r_card(r1, "TOTAL INVESTIDO", f"R$ {inv:,.2f}", "#334155")
+            r_card(r2, "SALDO MEDIANO (P50)", f"R$ {p50[-1]:,.2f}", C_ACCENT)
+            r_card(r3, "FAIXA P5 – P95", f"R$ {p5[-1]:,.0f} – {p95[-1]:,.0f}", C_REAL)
+            st.markdown("###")
+            fig_s = go.Figure()
+            fig_s.add_trace(go.Scatter(x=meses, y=p95, line=dict(color=C_ACCENT, width=0), showlegend=False, name="P95"))
+            fig_s.add_trace(go.Scatter(x=meses, y=p5, fill='tonexty', fillcolor="rgba(249, 115, 22, 0.2)", line=dict(color=C_ACCENT, width=0), name="Faixa P5–P95"))
+            fig_s.add_trace(go.Scatter(x=meses, y=p50, line=dict(color=C_ACCENT, width=3), name="Mediana (P50)"))
+            fig_s.add_trace(go.Scatter(x=meses, y=ini + mes * meses, line=dict(color="#94A3B8", width=2, dash='dash'), name="Aporte Acumulado"))
+            fig_s.update_layout(hovermode="x unified", **layout_calc)
+            st.plotly_chart(fig_s, use_container_width=True)
+
+            st.markdown("#### Comparativo dos Indexadores")
+            st.caption(f"Saldo final em {anos} ano(s): {pct:.0f}% do CDI, IPCA + {fx:.2f}% e pré {pre:.2f}% a.a.")
+            st.dataframe(pd.DataFrame({k: v[:, -1] for k, v in fan.items()}, index=["P5", "P50", "P95"]).T.style.format("R$ {:,.2f}"), use_container_width=True)
+
+    # EXPORTAÇÃO DA PROJEÇÃO: gerada em memória no clique, uma aba (ou arquivo) por tabela
+    if proj:
+        with col_out:
+            c_fmt, c_btn = st.columns([3, 1])
+            with c_fmt: fmt_proj = st.radio("Formato", list(EXPORT_FORMATOS), horizontal=True, key="export_fmt_proj", label_visibility="collapsed")
+            ext, mime = export_ext(proj, fmt_proj)
+            with c_btn: st.download_button("Baixar", data=lambda tabelas=proj, fmt=fmt_proj: export_bytes(tabelas, fmt), file_name=f"obinvest_projecao.{ext}", mime=mime, key="export_proj", use_container_width=True)
 
 elif nav == "Glossário":
     st.markdown("<h1>Glossário Financeiro</h1>", unsafe_allow_html=True)
@@ -562,3 +556,28 @@ elif nav == "Glossário":
     with c4: gloss_card("Pré-fixado", "Taxa fixa combinada na compra. Você sabe exatamente quanto vai receber.", C_ACCENT)
     with c5: gloss_card("Híbrido (IPCA+)", "Parte fixa + Inflação. Garante ganho real acima da inflação.", C_IPCA)
     st.markdown("---"); st.caption("Fonte: Banco Central do Brasil.")
+
+elif nav == "Diagnóstico":
+    st.markdown("<h1>Diagnóstico</h1>", unsafe_allow_html=True)
+    st.markdown(f"<p class='section-caption'>Métricas deste processo desde o início. Snapshot {snap['version']} ({fmt_idade(snap['fetched_at'])}), {sum(len(s) for s in ds.values()):,} observações.</p>".replace(",", "."), unsafe_allow_html=True)
+
+    c1, c2 = st.columns(2, gap="medium")
+    with c1:
+        st.markdown("#### Etapas (ms)")
+        st.dataframe(METRICS.resumo("obinvest_stage_seconds").style.format("{:.1f}", subset=["média", "p50", "p95", "máx"]), use_container_width=True)
+        st.markdown("#### Páginas (ms)")
+        st.dataframe(METRICS.resumo("obinvest_page_seconds").style.format("{:.1f}", subset=["média", "p50", "p95", "máx"]), use_container_width=True)
+    with c2:
+        st.markdown("#### Requisições ao BCB (ms)")
+        st.dataframe(METRICS.resumo("obinvest_upstream_seconds").style.format("{:.1f}", subset=["média", "p50", "p95", "máx"]), use_container_width=True)
+        st.dataframe(pd.Series(METRICS.contadores("obinvest_upstream", "obinvest_refresh"), name="total", dtype="int64"), use_container_width=True)
+        st.markdown("#### Caches")
+        chamadas = METRICS.contadores("obinvest_cache_calls_total", rotulo="fn")
+        misses = {f: METRICS.counter_value("obinvest_cache_misses_total", fn=f) for f in chamadas}
+        fns = list(chamadas)
+        st.dataframe(pd.DataFrame({"chamadas": chamadas, "misses": misses, "acertos (%)": {f: 100 * (1 - misses[f] / chamadas[f]) for f in fns}}).style.format("{:.1f}", subset=["acertos (%)"]), use_container_width=True)
+
+    with st.expander("Formato Prometheus" + (f" (também em :{METRICS_PORT}/metrics)" if METRICS_PORT else "")):
+        st.code(METRICS.prometheus(), language="text")
+
+METRICS.observe("obinvest_page_seconds", time.perf_counter() - _t_pagina, page=nav)
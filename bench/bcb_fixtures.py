@@ -0,0 +1,167 @@
+"""
+Respostas gravadas das APIs do BCB (SGS e Olinda/Focus) para rodar o app sem rede.
+
+`install()` troca o cliente HTTP do python-bcb por um que responde a partir de bench/fixtures,
+no mesmo formato da API real (o parse do python-bcb roda normalmente). Qualquer outro host
+falha como se não houvesse conexão.
+
+    python bench/bcb_fixtures.py --record   # grava de novo as fixtures a partir das APIs reais
+"""
+import os
+import re
+import sys
+import json
+import argparse
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from urllib.parse import unquote
+
+import httpx
+import pandas as pd
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SGS_URL = re.compile(r"/dados/serie/bcdata\.sgs\.(\d+)/dados$")
+OLINDA_URL = "https://olinda.bcb.gov.br/olinda/servico/Expectativas/versao/v1/odata/"
+
+# Mesmos códigos do registro SERIES no obinvest.py (as do snapshot e as sob demanda)
+SGS_CODIGOS = [432, 13522, 13521, 1, 4380, 4389, 433, 1635, 10844, 188, 24369, 24364, 4513, 13762]
+FOCUS_ENTIDADES = ["ExpectativasMercadoInflacao12Meses", "ExpectativasMercadoAnuais"]
+# Mesmos indicadores de FOCUS_INDICADORES no obinvest.py
+FOCUS_INDICADORES = ["IPCA", "PIB Total", "Selic", "Câmbio"]
+RECORD_ANOS = 12
+RECORD_FOCUS_ANOS = 3
+
+# Operadores do $filter OData -> DataFrame.query
+ODATA_OPS = {"eq": "==", "ne": "!=", "ge": ">=", "gt": ">", "le": "<=", "lt": "<"}
+
+def _fixture(nome): return os.path.join(FIXTURES_DIR, nome)
+
+def gravado_em():
+    with open(_fixture("meta.json"), encoding="utf-8") as f: return date.fromisoformat(json.load(f)["gravado_em"])
+
+@lru_cache(maxsize=None)
+def load_sgs(codigo, hoje=None):
+    """
+    Série gravada como DataFrame (data, valor), deslocada para terminar hoje como terminava no
+    dia da gravação: semanas inteiras nas diárias (mantém os dias úteis), meses nas mensais.
+    """
+    hoje = hoje or date.today()
+    with open(_fixture(f"sgs_{codigo}.json"), encoding="utf-8") as f: df = pd.DataFrame(json.load(f))
+    datas = pd.to_datetime(df["data"], format="%d/%m/%Y")
+    gravado = gravado_em()
+    if (datas.dt.day == 1).all():
+        datas = datas + pd.DateOffset(months=(hoje.year - gravado.year) * 12 + hoje.month - gravado.month)
+    else:
+        datas = datas + timedelta(weeks=(hoje - gravado).days // 7)
+    return pd.DataFrame({"data": datas, "valor": df["valor"]})
+
+def sgs_response(codigo, params):
+    """
+    Corpo da resposta do SGS para /dados?formato=json&dataInicial=..&dataFinal=.. (datas dd/mm/aaaa).
+    """
+    df = load_sgs(codigo, date.today())
+    if "dataInicial" in params: df = df[df["data"] >= datetime.strptime(params["dataInicial"], "%d/%m/%Y")]
+    if "dataFinal" in params: df = df[df["data"] <= datetime.strptime(params["dataFinal"], "%d/%m/%Y")]
+    return [{"data": d.strftime("%d/%m/%Y"), "valor": v} for d, v in zip(df["data"], df["valor"])]
+
+@lru_cache(maxsize=None)
+def load_focus(entidade, hoje=None):
+    """
+    Publicações gravadas de uma entidade do Focus como DataFrame, deslocadas como em `load_sgs`:
+    Data em semanas inteiras e DataReferencia (ano) pelos anos desde a gravação.
+    """
+    hoje = hoje or date.today()
+    with open(_fixture(f"focus_{entidade}.json"), encoding="utf-8") as f: corpo = json.load(f)
+    df = pd.DataFrame(corpo["value"])
+    gravado = gravado_em()
+    df["Data"] = (pd.to_datetime(df["Data"]) + timedelta(weeks=(hoje - gravado).days // 7)).dt.strftime("%Y-%m-%d")
+    if "DataReferencia" in df: df["DataReferencia"] = (df["DataReferencia"].astype(int) + hoje.year - gravado.year).astype(str)
+    return corpo["@odata.context"], df
+
+def odata_filter(df, expr):
+    """
+    Aplica um $filter OData com comparações, and/or e parênteses (o que o python-bcb gera) ao DataFrame.
+    Datas sem aspas (Data ge 2024-01-01) são comparadas como texto ISO, como estão nas fixtures.
+    """
+    expr = re.sub(r"(?<!')\b(\d{4}-\d{2}-\d{2})\b(?!')", r"'\1'", expr)
+    expr = re.sub(r" (eq|ne|ge|gt|le|lt) ", lambda m: f" {ODATA_OPS[m.group(1)]} ", expr)
+    return df.query(expr, engine="python")
+
+def olinda_response(caminho, params):
+    """
+    (status, content-type, corpo) de uma URL do serviço de Expectativas: raiz, $metadata ou entidade.
+    As entidades devolvem as linhas gravadas, respeitando $filter, $orderby, $select e $top.
+    """
+    if caminho == "":
+        with open(_fixture("olinda_root.json"), "rb") as f: return 200, "application/json", f.read()
+    if caminho == "$metadata":
+        with open(_fixture("olinda_metadata.xml"), "rb") as f: return 200, "application/xml", f.read()
+    try:
+        contexto, df = load_focus(caminho, date.today())
+    except OSError:
+        return 404, "application/json", json.dumps({"error": f"Entidade {caminho} não gravada"}).encode()
+    if "$filter" in params: df = odata_filter(df, params["$filter"])
+    if "$orderby" in params:
+        campos = [c.split() for c in params["$orderby"].split(",")]
+        df = df.sort_values([c[0] for c in campos], ascending=[len(c) == 1 or c[1] == "asc" for c in campos], kind="stable")
+    if "$select" in params: df = df[params["$select"].split(",")]
+    if "$top" in params: df = df.head(int(params["$top"]))
+    return 200, "application/json", json.dumps({"@odata.context": contexto, "value": df.to_dict("records")}).encode()
+
+def handler(request):
+    url = request.url
+    params = {unquote(k): v for k, v in url.params.multi_items()}
+    if url.host == "api.bcb.gov.br" and SGS_URL.search(url.path):
+        return httpx.Response(200, json=sgs_response(int(SGS_URL.search(url.path).group(1)), params))
+    if str(url).startswith(OLINDA_URL):
+        status, tipo, corpo = olinda_response(url.path.split("/odata/", 1)[1], params)
+        return httpx.Response(status, content=corpo, headers={"content-type": tipo})
+    raise httpx.ConnectError(f"Sem rede (fixtures): {url}", request=request)
+
+def install():
+    """
+    Aponta o python-bcb (bcb.sgs e bcb.Expectativas) para as fixtures.
+    """
+    import bcb.http
+    bcb.http._CLIENT = httpx.Client(transport=httpx.MockTransport(handler), follow_redirects=True)
+
+def record():
+    """
+    Grava as fixtures com as respostas atuais das APIs do BCB (precisa de rede).
+    """
+    from bcb import sgs
+    hoje = date.today()
+    for codigo in SGS_CODIGOS:
+        # O SGS limita consultas de séries diárias a 10 anos: grava em janelas de 5
+        linhas = []
+        for ano in range(hoje.year - RECORD_ANOS, hoje.year + 1, 5):
+            ini, fim = date(ano, 1, 1), min(date(ano + 4, 12, 31), hoje)
+            linhas += json.loads(sgs.get_json(codigo, start=ini.isoformat(), end=fim.isoformat()))
+        with open(_fixture(f"sgs_{codigo}.json"), "w", encoding="utf-8") as f: json.dump(linhas, f, separators=(",", ":"))
+        print(f"SGS {codigo}: {len(linhas)} observações")
+
+    with httpx.Client(timeout=60, follow_redirects=True) as cli:
+        with open(_fixture("olinda_root.json"), "wb") as f: f.write(cli.get(OLINDA_URL).raise_for_status().content)
+        with open(_fixture("olinda_metadata.xml"), "wb") as f: f.write(cli.get(OLINDA_URL + "$metadata").raise_for_status().content)
+        # Histórico das publicações (o arquivo local do app), uma por semana para manter as fixtures pequenas
+        desde = (hoje - timedelta(days=365 * RECORD_FOCUS_ANOS)).isoformat()
+        indicadores = " or ".join(f"Indicador eq '{i}'" for i in FOCUS_INDICADORES)
+        consultas = {
+            "ExpectativasMercadoInflacao12Meses": (f"Suavizada eq 'S' and baseCalculo eq 0 and Data ge {desde}", "Indicador,Data,Suavizada,Mediana,baseCalculo"),
+            "ExpectativasMercadoAnuais": (f"({indicadores}) and baseCalculo eq 0 and Data ge {desde}", "Indicador,Data,DataReferencia,Mediana,baseCalculo"),
+        }
+        for ent, (filtro, campos) in consultas.items():
+            params = {"$filter": filtro, "$select": campos, "$orderby": "Data asc", "$format": "json"}
+            corpo = cli.get(OLINDA_URL + ent, params=params).raise_for_status().json()
+            ultima = max(r["Data"] for r in corpo["value"])
+            corpo["value"] = [r for r in corpo["value"] if date.fromisoformat(r["Data"]).weekday() == 4 or r["Data"] == ultima]
+            with open(_fixture(f"focus_{ent}.json"), "w", encoding="utf-8") as f: json.dump(corpo, f, ensure_ascii=False, separators=(",", ":"))
+            print(f"Focus {ent}: {len(corpo['value'])} publicações")
+
+    with open(_fixture("meta.json"), "w", encoding="utf-8") as f: json.dump({"gravado_em": hoje.isoformat(), "origem": "api.bcb.gov.br"}, f, indent=1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--record", action="store_true", help="grava as fixtures a partir das APIs reais")
+    if not parser.parse_args().record: parser.print_help(); sys.exit(0)
+    record()
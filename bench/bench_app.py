@@ -0,0 +1,212 @@
+"""
+Benchmark headless do appy2.py (Streamlit AppTest) contra as respostas gravadas do BCB.
+
+Mede a partida a frio (sem histórico em disco), a partida com o histórico em disco, o rerun de
+cada página, a troca de gráfico, a paginação da tabela e a mudança de parâmetros da calculadora.
+Mostra percentis e pico de memória e compara com bench/baseline.json: sai com código 1 se uma
+métrica acompanhada piorar além da tolerância. Roda sem rede (ver bcb_fixtures.py).
+
+    python bench/bench_app.py                   # roda e compara com a baseline
+    python bench/bench_app.py --save-baseline   # grava a baseline desta máquina
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import warnings
+import tracemalloc
+from datetime import date
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bcb_fixtures
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(BENCH_DIR, os.pardir, "appy2.py")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+TIMEOUT = 120
+
+PAGINAS = ["Dados Macroeconômicos", "Calculadora de Rentabilidade", "Glossário"]
+GRAFICOS = ["Selic", "IPCA", "Juro Real", "Dolar", "IGPM", "PIB"]
+CALC_ANOS = [3, 10, 20, 30, 5]
+CALC_MODOS = ["Média 5 anos", "Monte Carlo", "Backtest histórico"]
+
+# Tolerância das métricas acompanhadas: fração sobre a baseline + folga absoluta (ruído de medição)
+TOLERANCIA = {"s": (0.30, 0.025), "MB": (0.20, 5.0)}
+
+# ==============================================================================
+# CENÁRIOS
+# ==============================================================================
+
+def _calc_param(at, i):
+    # Alterna prazo (slider) e modo de projeção: cada combinação calcula uma vez e depois vem do cache
+    at.slider[0].set_value(CALC_ANOS[i % len(CALC_ANOS)])
+    at.main.radio[0].set_value(CALC_MODOS[(i // len(CALC_ANOS)) % len(CALC_MODOS)])
+    at.run()
+
+# nome: (página, ação da i-ésima repetição)
+CENARIOS = {
+    "rerun_dados": (PAGINAS[0], lambda at, i: at.run()),
+    "rerun_calculadora": (PAGINAS[1], lambda at, i: at.run()),
+    "rerun_glossario": (PAGINAS[2], lambda at, i: at.run()),
+    "troca_grafico": (PAGINAS[0], lambda at, i: at.button(key=f"btn_{GRAFICOS[i % len(GRAFICOS)]}").click().run()),
+    "paginacao": (PAGINAS[0], lambda at, i: at.button(key="n" if (i // 5) % 2 == 0 else "p").click().run()),
+    "calc_parametros": (PAGINAS[1], _calc_param),
+}
+
+def _check(at, nome):
+    if at.exception: raise RuntimeError(f"{nome}: exceção no app: {at.exception[0].value}")
+
+def _nova_sessao(data_dir):
+    """
+    Simula um processo novo: caches do Streamlit vazios (inclui o DataRefresher), a camada de dados (obinvest)
+    importada de novo e a pasta de dados indicada.
+    """
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    sys.modules.pop("obinvest", None) # DATA_DIR e afins são lidos na importação
+    os.environ["OBINVEST_DATA_DIR"] = data_dir
+    return AppTest.from_file(APP_PATH, default_timeout=TIMEOUT)
+
+def _partida(data_dir):
+    at = _nova_sessao(data_dir)
+    t = time.perf_counter(); at.run(); dt = time.perf_counter() - t
+    _check(at, "partida")
+    return at, dt
+
+def _ir_para(at, pagina):
+    if at.sidebar.radio[0].value != pagina: at.sidebar.radio[0].set_value(pagina).run()
+
+def percentis(amostras):
+    a = np.asarray(amostras)
+    return {"p50": float(np.percentile(a, 50)), "p90": float(np.percentile(a, 90)), "max": float(a.max()), "n": len(a)}
+
+def run(repeticoes, partidas):
+    """
+    Executa todos os cenários. Retorna {métrica: {p50, p90, max, n} | valor}.
+    """
+    import streamlit.logger
+    streamlit.logger.set_log_level("error") # avisos de depreciação repetidos a cada rerun
+    warnings.simplefilter("ignore", FutureWarning)
+    os.environ.setdefault("OBINVEST_LOG_LEVEL", "WARNING") # eventos JSON do app
+    bcb_fixtures.install()
+    tmp = tempfile.mkdtemp(prefix="obinvest-bench-")
+    res = {}
+    try:
+        # Partida a frio: pasta de dados vazia, a página espera a primeira carga (fixtures)
+        frio = []
+        for k in range(partidas):
+            at, dt = _partida(os.path.join(tmp, f"frio{k}"))
+            frio.append(dt)
+        res["partida_fria"] = percentis(frio)
+
+        # Partida com histórico em disco: a página não espera a rede
+        disco = []
+        for _ in range(partidas):
+            at, dt = _partida(os.path.join(tmp, f"frio{partidas - 1}"))
+            disco.append(dt)
+        res["partida_disco"] = percentis(disco)
+
+        # Reruns e interações na mesma sessão (caches quentes)
+        for nome, (pagina, acao) in CENARIOS.items():
+            _ir_para(at, pagina)
+            acao(at, 0) # aquecimento
+            tempos = []
+            for i in range(1, repeticoes + 1):
+                t = time.perf_counter(); acao(at, i); tempos.append(time.perf_counter() - t)
+                _check(at, nome)
+            res[nome] = percentis(tempos)
+
+        # Memória: pico do heap Python por cenário (uma repetição sob tracemalloc) e pico de RSS do processo
+        tracemalloc.start()
+        for nome, (pagina, acao) in CENARIOS.items():
+            _ir_para(at, pagina)
+            tracemalloc.reset_peak()
+            acao(at, repeticoes + 1)
+            res[f"mem_{nome}"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        res["mem_pico_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return res
+
+# ==============================================================================
+# RELATÓRIO E COMPARAÇÃO COM A BASELINE
+# ==============================================================================
+
+def metricas(res):
+    """
+    Métricas acompanhadas (comparadas com a baseline): p50 dos tempos e picos de memória.
+    """
+    out = {}
+    for nome, v in res.items():
+        if isinstance(v, dict): out[f"{nome}.p50"] = (round(v["p50"], 4), "s")
+        else: out[nome] = (round(v, 1), "MB")
+    return out
+
+def relatorio(res):
+    print(f"{'cenário':<22}{'p50 (ms)':>10}{'p90 (ms)':>10}{'máx (ms)':>10}{'n':>5}")
+    for nome, v in res.items():
+        if isinstance(v, dict): print(f"{nome:<22}{v['p50']*1000:>10.1f}{v['p90']*1000:>10.1f}{v['max']*1000:>10.1f}{v['n']:>5}")
+    print()
+    for nome, v in res.items():
+        if not isinstance(v, dict): print(f"{nome:<22}{v:>10.1f} MB")
+
+def compara(atual, baseline, fator=1.0):
+    """
+    Lista as regressões: métrica acima de baseline * (1 + tolerância) + folga.
+    """
+    regressoes = []
+    for nome, (valor, unidade) in atual.items():
+        if nome not in baseline: continue
+        rel, abs_ = TOLERANCIA[unidade]
+        limite = baseline[nome] * (1 + rel * fator) + abs_ * fator
+        if valor > limite: regressoes.append(f"{nome}: {valor:.4g} {unidade} > limite {limite:.4g} (baseline {baseline[nome]:.4g})")
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="repetições por cenário (padrão 20)")
+    parser.add_argument("--starts", type=int, default=3, help="partidas a frio e com disco (padrão 3)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="arquivo da baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="grava o resultado como baseline")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="multiplica as tolerâncias (ex.: 2 em máquinas ruidosas)")
+    parser.add_argument("--json", help="grava o resultado completo neste arquivo")
+    args = parser.parse_args()
+
+    res = run(args.repeat, args.starts)
+    relatorio(res)
+    atual = metricas(res)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(res, f, indent=1)
+
+    if args.save_baseline:
+        import streamlit
+        meta = {"data": date.today().isoformat(), "python": platform.python_version(), "streamlit": streamlit.__version__, "maquina": platform.machine()}
+        with open(args.baseline, "w", encoding="utf-8") as f: json.dump({"meta": meta, "metricas": {k: v for k, (v, _) in atual.items()}}, f, indent=1, ensure_ascii=False)
+        print(f"\nBaseline gravada em {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)["metricas"]
+    except (OSError, ValueError, KeyError):
+        print(f"\nSem baseline em {args.baseline}: rode com --save-baseline")
+        return 0
+    regressoes = compara(atual, baseline, args.tolerance)
+    print()
+    if regressoes:
+        print("REGRESSÃO:"); print("\n".join(f"  {r}" for r in regressoes))
+        return 1
+    print(f"OK: {len(atual)} métricas dentro da tolerância")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
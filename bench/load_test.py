@@ -0,0 +1,182 @@
+"""
+Teste de carga: várias sessões simultâneas num servidor `streamlit run appy2.py` de verdade, ligado ao
+BCB local (mock_bcb.py) com latência, erros e limitação de taxa injetados.
+
+Cada sessão abre o app pelo websocket (como o navegador), troca de gráfico e vai para a calculadora.
+Mostra o tempo de cada etapa e quantas requisições chegaram ao "BCB", por rota e por status: com o
+cache do processo, N sessões devem gerar uma única carga. Com --processes, as sessões se dividem entre
+vários servidores com a mesma pasta de dados (como atrás de um balanceador), que também devem gerar uma só.
+
+    python bench/load_test.py --sessions 50 --latency 0.3 --jitter 0.3 --error-rate 0.1 --rate-limit 10
+    python bench/load_test.py --sessions 50 --processes 4
+    python bench/load_test.py --sessions 20 --slow-rate 0.1 --slow-latency 8   # cauda lenta: cópias (hedge) do app
+"""
+import os
+import sys
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mock_bcb
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+GRAFICOS = ["Selic", "IPCA", "Dolar", "PIB"]
+
+# ==============================================================================
+# SERVIDOR STREAMLIT
+# ==============================================================================
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_app(bcb_url, data_dir, timeout=60):
+    """
+    Sobe `streamlit run appy2.py` apontado para o BCB local. Retorna (processo, porta).
+    """
+    porta = _porta_livre()
+    env = {**os.environ, "OBINVEST_BCB_URL": bcb_url, "OBINVEST_DATA_DIR": data_dir}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "appy2.py", "--server.headless", "true", "--server.port", str(porta),
+         "--browser.gatherUsageStats", "false", "--logger.level", "error"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            if httpx.get(f"http://127.0.0.1:{porta}/_stcore/health").status_code == 200: return proc, porta
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("Servidor Streamlit não subiu")
+
+# ==============================================================================
+# SESSÕES (PROTOCOLO DO NAVEGADOR: BackMsg/ForwardMsg pelo websocket)
+# ==============================================================================
+
+class Sessao:
+    def __init__(self, ws):
+        self.ws = ws
+        self.widgets = {} # rótulo/chave -> id do widget
+        self.excecoes = self.erros = 0
+
+    async def run(self, widget=None):
+        """
+        Pede um rerun (opcionalmente com um widget alterado) e espera o fim do script. Retorna a duração.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        if widget:
+            w = msg.rerun_script.widget_states.widgets.add()
+            w.id = widget[0]
+            setattr(w, widget[1], widget[2])
+        t = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            tipo = fwd.WhichOneof("type")
+            if tipo == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                el = fwd.delta.new_element
+                tipo_el = el.WhichOneof("type")
+                if tipo_el == "exception": self.excecoes += 1
+                elif tipo_el == "alert" and el.alert.format == el.alert.ERROR: self.erros += 1
+                elif tipo_el in ("radio", "button"):
+                    w = getattr(el, tipo_el)
+                    self.widgets[w.label if tipo_el == "radio" else w.id.rsplit("-", 1)[-1]] = w.id
+            # st.rerun() termina a execução antes da hora e já emenda a próxima
+            if tipo == "script_finished" and fwd.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return time.perf_counter() - t
+
+async def sessao(i, porta, res, timeout):
+    from websockets.asyncio.client import connect
+    try:
+        async with connect(f"ws://127.0.0.1:{porta}/_stcore/stream", subprotocols=["streamlit"], max_size=None, open_timeout=timeout) as ws:
+            s = Sessao(ws)
+            abertura = await asyncio.wait_for(s.run(), timeout)
+            botao = next((wid for k, wid in s.widgets.items() if k == f"btn_{GRAFICOS[i % len(GRAFICOS)]}"), None)
+            grafico = await asyncio.wait_for(s.run((botao, "trigger_value", True)), timeout) if botao else None
+            calc = await asyncio.wait_for(s.run((s.widgets["Navegação"], "string_value", "Calculadora de Rentabilidade")), timeout)
+            res.append({"abertura": abertura, "grafico": grafico, "calculadora": calc, "excecoes": s.excecoes, "erros": s.erros})
+    except Exception as e:
+        res.append({"falha": f"{type(e).__name__}: {e}"})
+
+async def carga(portas, n, timeout):
+    res = []
+    await asyncio.gather(*(sessao(i, portas[i % len(portas)], res, timeout) for i in range(n)))
+    return res
+
+# ==============================================================================
+# RELATÓRIO
+# ==============================================================================
+
+def _linha(nome, v):
+    v = [x for x in v if x is not None]
+    if not v: return
+    a = np.asarray(v)
+    print(f"{nome:<12}p50 {np.percentile(a, 50):7.2f} s   p90 {np.percentile(a, 90):7.2f} s   máx {a.max():7.2f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50, help="sessões simultâneas (padrão 50)")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fração das respostas do BCB com --slow-latency a mais")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--processes", type=int, default=1, help="servidores Streamlit com a mesma pasta de dados (padrão 1)")
+    parser.add_argument("--warm", action="store_true", help="parte de um histórico já em disco (padrão: pasta vazia)")
+    parser.add_argument("--timeout", type=float, default=300, help="tempo máximo por etapa de uma sessão (s)")
+    args = parser.parse_args()
+
+    srv, bcb_url = mock_bcb.start(latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                                  error_rate=args.error_rate, rate_limit=args.rate_limit)
+    tmp = tempfile.mkdtemp(prefix="obinvest-carga-")
+    procs = []
+    try:
+        if args.warm:
+            # Um processo anterior, sem falhas, grava o histórico em disco
+            cfg = dict(srv.config); srv.config.update(error_rate=0, latency=0, jitter=0, slow_rate=0, rate_limit=0)
+            proc, porta = start_app(bcb_url, tmp)
+            asyncio.run(carga([porta], 1, args.timeout))
+            proc.terminate(); proc.wait()
+            # Tentativa recente na trava faria os próximos processos reaproveitarem o disco sem buscar
+            os.remove(os.path.join(tmp, "refresh.lock"))
+            srv.config.update(cfg); srv.reset_stats()
+
+        for _ in range(args.processes): procs.append(start_app(bcb_url, tmp))
+        t = time.perf_counter()
+        res = asyncio.run(carga([porta for _, porta in procs], args.sessions, args.timeout))
+        total = time.perf_counter() - t
+    finally:
+        for proc, _ in procs: proc.terminate(); proc.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    ok = [r for r in res if "falha" not in r]
+    print(f"{args.sessions} sessões em {args.processes} processo(s), {total:.1f} s ({'histórico em disco' if args.warm else 'pasta vazia'})")
+    for etapa in ("abertura", "grafico", "calculadora"): _linha(etapa, [r[etapa] for r in ok])
+    falhas = [r["falha"] for r in res if "falha" in r]
+    excecoes = sum(r["excecoes"] for r in ok)
+    print(f"exceções no app: {excecoes}   sessões com st.error: {sum(r['erros'] > 0 for r in ok)}   falhas de sessão: {len(falhas)}")
+    for f in falhas[:5]: print(f"  {f}")
+
+    stats = srv.snapshot_stats()
+    print(f"\nBCB local: {sum(v for k, v in stats['requisicoes'].items() if not k.startswith('status_'))} requisições, pico de {stats['pico_em_voo']} simultâneas")
+    for k, v in sorted(stats["requisicoes"].items()): print(f"  {k:<45}{v:>6}")
+    srv.shutdown()
+    return 1 if falhas or excecoes else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Servidor local no lugar das APIs do BCB (SGS e Olinda/Focus), servindo as fixtures de bench/fixtures.
+
+Injeta latência, erros e limitação de taxa (429) conforme a configuração, que pode ser trocada com
+o servidor no ar: GET/POST /_control (JSON) e GET/DELETE /_stats. Para apontar o app para ele:
+
+    python bench/mock_bcb.py --port 8765 --latency 0.3 --error-rate 0.1 --rate-limit 20
+    OBINVEST_BCB_URL=http://127.0.0.1:8765 streamlit run appy2.py
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bcb_fixtures
+
+OLINDA_PREFIX = "/olinda/servico/Expectativas/versao/v1/odata/"
+
+CONFIG_PADRAO = {
+    "latency": 0.0, # Atraso fixo por requisição (s)
+    "jitter": 0.0, # Atraso extra aleatório, uniforme em [0, jitter] (s)
+    "slow_rate": 0.0, # Fração das requisições que demoram slow_latency a mais (cauda de latência)
+    "slow_latency": 5.0,
+    "error_rate": 0.0, # Fração das requisições respondidas com error_status
+    "error_status": 503,
+    "rate_limit": 0.0, # Requisições por segundo antes de responder 429 (0 = sem limite)
+    "retry_after": 1, # Valor do cabeçalho Retry-After nas respostas 429
+}
+
+class MockBCB(ThreadingHTTPServer):
+    """
+    Servidor com a configuração de falhas e os contadores compartilhados entre as threads.
+    """
+    daemon_threads = True
+
+    def __init__(self, addr, verbose=False, **config):
+        super().__init__(addr, Handler)
+        self.config = {**CONFIG_PADRAO, **config}
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = Counter()
+            self.em_voo = self.pico_em_voo = 0
+            # Balde de fichas da limitação de taxa (capacidade de 1 s de requisições)
+            self.fichas, self.fichas_ts = self.config["rate_limit"], time.monotonic()
+
+    def admite(self):
+        """
+        Consome uma ficha do limitador; False quando a taxa configurada foi excedida.
+        """
+        taxa = self.config["rate_limit"]
+        if taxa <= 0: return True
+        with self.lock:
+            agora = time.monotonic()
+            self.fichas = min(taxa, self.fichas + (agora - self.fichas_ts) * taxa)
+            self.fichas_ts = agora
+            if self.fichas < 1: return False
+            self.fichas -= 1
+            return True
+
+    def snapshot_stats(self):
+        with self.lock: return {"requisicoes": dict(self.stats), "em_voo": self.em_voo, "pico_em_voo": self.pico_em_voo}
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose: super().log_message(fmt, *args)
+
+    def _responde(self, status, corpo, tipo="application/json", headers=None):
+        if isinstance(corpo, (dict, list)): corpo = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        for k, v in (headers or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _conta(self, rota, status):
+        with self.server.lock:
+            self.server.stats[rota] += 1
+            self.server.stats[f"status_{status}"] += 1
+
+    # Controle do servidor (não sofre injeção de falhas)
+    def _controle(self, metodo, caminho):
+        srv = self.server
+        if caminho == "/_control":
+            if metodo == "POST":
+                corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                desconhecidas = set(corpo) - set(CONFIG_PADRAO)
+                if desconhecidas: return self._responde(400, {"error": f"Chaves desconhecidas: {sorted(desconhecidas)}"})
+                srv.config.update(corpo)
+            return self._responde(200, srv.config)
+        if caminho == "/_stats":
+            if metodo == "DELETE": srv.reset_stats()
+            return self._responde(200, srv.snapshot_stats())
+        return self._responde(404, {"error": f"Caminho desconhecido: {caminho}"})
+
+    def do_POST(self): self._controle("POST", urlsplit(self.path).path)
+    def do_DELETE(self): self._controle("DELETE", urlsplit(self.path).path)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith("/_"): return self._controle("GET", url.path)
+        params = dict(parse_qsl(url.query))
+        srv, cfg = self.server, self.server.config
+
+        m = bcb_fixtures.SGS_URL.search(url.path)
+        if m: rota = f"sgs_{m.group(1)}"
+        elif url.path.startswith(OLINDA_PREFIX): rota = "focus_" + (url.path[len(OLINDA_PREFIX):] or "raiz")
+        else: rota = "desconhecida"
+
+        with srv.lock:
+            srv.em_voo += 1
+            srv.pico_em_voo = max(srv.pico_em_voo, srv.em_voo)
+        try:
+            if not srv.admite():
+                self._conta(rota, 429)
+                return self._responde(429, {"error": "Too Many Requests"}, headers={"Retry-After": str(cfg["retry_after"])})
+            time.sleep(cfg["latency"] + random.uniform(0, cfg["jitter"]) + (cfg["slow_latency"] if random.random() < cfg["slow_rate"] else 0))
+            if random.random() < cfg["error_rate"]:
+                self._conta(rota, cfg["error_status"])
+                return self._responde(cfg["error_status"], b"<html><body>Service Unavailable</body></html>", "text/html")
+
+            if m:
+                status, tipo, corpo = 200, "application/json", bcb_fixtures.sgs_response(int(m.group(1)), params)
+            elif url.path.startswith(OLINDA_PREFIX):
+                status, tipo, corpo = bcb_fixtures.olinda_response(url.path[len(OLINDA_PREFIX):], params)
+            else:
+                status, tipo, corpo = 404, "application/json", {"error": f"Caminho desconhecido: {url.path}"}
+            self._conta(rota, status)
+            self._responde(status, corpo, tipo)
+        finally:
+            with srv.lock: srv.em_voo -= 1
+
+def start(host="127.0.0.1", port=0, **config):
+    """
+    Sobe o servidor numa thread. Retorna (servidor, url base); port=0 escolhe uma porta livre.
+    """
+    srv = MockBCB((host, port), **config)
+    threading.Thread(target=srv.serve_forever, name="mock-bcb", daemon=True).start()
+    return srv, f"http://{host}:{srv.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="atraso fixo por requisição (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="atraso extra aleatório até este valor (s)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fração de respostas com --slow-latency a mais")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas com erro")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requisições/s antes de responder 429 (0 = sem limite)")
+    parser.add_argument("--verbose", action="store_true", help="loga cada requisição")
+    args = parser.parse_args()
+
+    srv = MockBCB((args.host, args.port), verbose=args.verbose, latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                  error_rate=args.error_rate, error_status=args.error_status, rate_limit=args.rate_limit)
+    print(f"BCB local em http://{args.host}:{srv.server_address[1]} (OBINVEST_BCB_URL)")
+    try: srv.serve_forever()
+    except KeyboardInterrupt: pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1506 @@
+"""
+Camada de dados do OBInvest: métricas e instrumentação, transporte HTTP do BCB, armazenamento local das
+séries SGS, Focus, gráficos e tabelas em cache, projeções da calculadora, exportação e atualização em
+segundo plano.
+
+Importada pelo appy2.py: o Streamlit reexecuta a página a cada rerun, mas este módulo fica em sys.modules
+e é carregado uma vez por processo (decoradores de cache, transportes, servidor de métricas).
+"""
+import streamlit as st
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+import time
+import os
+import io
+import json
+import zipfile
+import threading
+import logging
+import functools
+import operator
+import sqlite3
+from collections import deque
+from types import MappingProxyType
+from contextlib import contextmanager, closing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+try:
+    import fcntl # Trava do refresh entre processos (POSIX)
+except ImportError:
+    fcntl = None
+
+# Paleta de Cores
+C_SIDEBAR = "#0F172A"
+C_MAIN = "#F8FAFC"
+C_ACCENT = "#F97316"
+C_TEXT_MAIN = "#1E293B"
+C_TEXT_SIDE = "#FFFFFF"
+C_INPUT_BG = "#1E293B"
+
+# Cores dos Indicadores
+C_SELIC = "#334155"
+C_IPCA = "#D97706"
+C_REAL = "#059669"
+C_DOLAR = "#0EA5E9"
+C_IGPM = "#8B5CF6"
+C_PIB = "#EAB308"
+
+# ==============================================================================
+# INSTRUMENTAÇÃO (TEMPOS POR ETAPA, REQUISIÇÕES AO BCB E CACHES)
+# ==============================================================================
+# Métricas do processo: na página oculta ?diag=1 e, com OBINVEST_METRICS_PORT, em /metrics
+# (formato Prometheus). Eventos em JSON, um por linha, no logger "obinvest" (OBINVEST_LOG_LEVEL).
+
+METRICS_PORT = os.environ.get("OBINVEST_METRICS_PORT")
+METRICS_HOST = os.environ.get("OBINVEST_METRICS_HOST", "127.0.0.1") # Só local, salvo pedido explícito (ex.: 0.0.0.0)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Metrics:
+    """
+    Contadores e histogramas com rótulos, compartilhados por todas as sessões e threads do processo.
+    Os histogramas guardam os buckets (Prometheus) e as últimas amostras (percentis da página de diagnóstico).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.hists = {}
+
+    @staticmethod
+    def _chave(nome, labels): return (nome, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, nome, n=1, **labels):
+        chave = self._chave(nome, labels)
+        with self.lock: self.counters[chave] = self.counters.get(chave, 0) + n
+
+    def set(self, nome, valor, **labels):
+        with self.lock: self.gauges[self._chave(nome, labels)] = valor
+
+    def observe(self, nome, valor, **labels):
+        chave = self._chave(nome, labels)
+        with self.lock:
+            h = self.hists.get(chave)
+            if h is None: h = self.hists[chave] = {"buckets": [0] * len(STAGE_BUCKETS), "soma": 0.0, "n": 0, "max": 0.0, "amostras": deque(maxlen=512)}
+            for i, b in enumerate(STAGE_BUCKETS):
+                if valor <= b: h["buckets"][i] += 1
+            h["soma"] += valor; h["n"] += 1; h["max"] = max(h["max"], valor)
+            h["amostras"].append(valor)
+
+    def percentil(self, nome, q, minimo=1, **labels):
+        """
+        Percentil q (0-100) das últimas amostras de um histograma; None com menos de `minimo` amostras.
+        """
+        with self.lock:
+            h = self.hists.get(self._chave(nome, labels))
+            amostras = list(h["amostras"]) if h else []
+        return float(np.percentile(amostras, q)) if len(amostras) >= minimo else None
+
+    def counter_value(self, nome, **labels):
+        return self.counters.get(self._chave(nome, labels), 0)
+
+    def contadores(self, *prefixos, rotulo=None):
+        """
+        Cópia dos contadores cujo nome começa com um dos prefixos, como {"nome{rótulos}": valor}
+        (ou {valor do rótulo: valor} com `rotulo`).
+        """
+        with self.lock: itens = sorted((k, v) for k, v in self.counters.items() if k[0].startswith(prefixos))
+        if rotulo: return {dict(l)[rotulo]: v for (n, l), v in itens}
+        return {f"{n}{{{', '.join(f'{k}={v}' for k, v in l)}}}": v for (n, l), v in itens}
+
+    def prometheus(self):
+        """
+        Texto no formato de exposição do Prometheus.
+        """
+        fmt = lambda labels, extra=(): "{" + ",".join(f'{k}="{v}"' for k, v in (*labels, *extra)) + "}" if labels or extra else ""
+        linhas = []
+        with self.lock:
+            for nome in sorted({n for n, _ in self.counters}):
+                linhas.append(f"# TYPE {nome} counter")
+                linhas += [f"{nome}{fmt(l)} {v}" for (n, l), v in sorted(self.counters.items()) if n == nome]
+            for nome in sorted({n for n, _ in self.gauges}):
+                linhas.append(f"# TYPE {nome} gauge")
+                linhas += [f"{nome}{fmt(l)} {v}" for (n, l), v in sorted(self.gauges.items()) if n == nome]
+            for nome in sorted({n for n, _ in self.hists}):
+                linhas.append(f"# TYPE {nome} histogram")
+                for (n, l), h in sorted(self.hists.items(), key=lambda x: x[0]):
+                    if n != nome: continue
+                    linhas += [f"{nome}_bucket{fmt(l, [('le', b)])} {c}" for b, c in zip(STAGE_BUCKETS, h["buckets"])]
+                    linhas += [f"{nome}_bucket{fmt(l, [('le', '+Inf')])} {h['n']}", f"{nome}_sum{fmt(l)} {h['soma']:.6f}", f"{nome}_count{fmt(l)} {h['n']}"]
+        return "\n".join(linhas) + "\n"
+
+    def resumo(self, nome):
+        """
+        DataFrame com contagem, média, p50, p95 e máximo (ms) de um histograma, uma linha por rótulo.
+        """
+        with self.lock:
+            linhas = {", ".join(f"{k}={v}" for k, v in l): (h["n"], h["soma"] / h["n"], *np.percentile(list(h["amostras"]), [50, 95]), h["max"])
+                      for (n, l), h in self.hists.items() if n == nome}
+        df = pd.DataFrame.from_dict(linhas, orient="index", columns=["n", "média", "p50", "p95", "máx"])
+        df.iloc[:, 1:] *= 1000
+        return df.sort_values("média", ascending=False)
+
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    """
+    Registro de métricas e logger estruturado, criados uma vez por processo.
+    """
+    log = logging.getLogger("obinvest")
+    log.setLevel(os.environ.get("OBINVEST_LOG_LEVEL", "INFO").upper())
+    if not log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(handler)
+        log.propagate = False
+    return Metrics()
+
+METRICS = get_metrics()
+log = logging.getLogger("obinvest")
+
+def log_event(evento, nivel=logging.INFO, **campos):
+    if log.isEnabledFor(nivel):
+        log.log(nivel, json.dumps({"ts": datetime.now().isoformat(timespec="milliseconds"), "nivel": logging.getLevelName(nivel), "evento": evento, **campos}, ensure_ascii=False, default=str))
+
+def log_error(etapa, erro, **campos):
+    """
+    Falha tratada (a aplicação segue com o que tem): evento "erro" (ERROR) e contador obinvest_errors_total{etapa=...}.
+    """
+    METRICS.inc("obinvest_errors_total", etapa=etapa)
+    log_event("erro", logging.ERROR, etapa=etapa, tipo=type(erro).__name__, erro=str(erro), **campos)
+
+@contextmanager
+def timed(etapa, **labels):
+    """
+    Mede a duração de uma etapa: histograma obinvest_stage_seconds{stage=...} e evento "etapa" (DEBUG).
+    """
+    t = time.perf_counter()
+    try: yield
+    finally:
+        dt = time.perf_counter() - t
+        METRICS.observe("obinvest_stage_seconds", dt, stage=etapa, **labels)
+        log_event("etapa", logging.DEBUG, etapa=etapa, ms=round(dt * 1000, 2), **labels)
+
+def instrumented_cache(cache, **kw):
+    """
+    st.cache_data/st.cache_resource que também conta chamadas e execuções (misses) e mede as execuções.
+    """
+    def deco(fn):
+        nome = fn.__name__
+        @functools.wraps(fn)
+        def executa(*a, **k):
+            METRICS.inc("obinvest_cache_misses_total", fn=nome)
+            with timed(nome): return fn(*a, **k)
+        cached = cache(**kw)(executa)
+        @functools.wraps(fn)
+        def chama(*a, **k):
+            METRICS.inc("obinvest_cache_calls_total", fn=nome)
+            return cached(*a, **k)
+        chama.clear = cached.clear
+        return chama
+    return deco
+
+def _bcb_api(url): return "sgs" if "bcdata.sgs" in url.path else "focus"
+
+def _bcb_request(request):
+    request.extensions["obinvest_t0"] = time.perf_counter()
+
+def _bcb_response(response):
+    # O corpo é lido aqui para que a latência inclua a transferência
+    response.read()
+    req = response.request
+    dt = time.perf_counter() - req.extensions.get("obinvest_t0", time.perf_counter())
+    api = _bcb_api(req.url)
+    METRICS.observe("obinvest_upstream_seconds", dt, api=api)
+    METRICS.inc("obinvest_upstream_requests_total", api=api, status=response.status_code)
+    log_event("upstream", api=api, path=req.url.path, status=response.status_code, ms=round(dt * 1000, 1), bytes=len(response.content))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        ok = urlsplit(self.path).path == "/metrics"
+        corpo = METRICS.prometheus().encode() if ok else b"Use /metrics\n"
+        self.send_response(200 if ok else 404)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args): pass
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server(porta):
+    """
+    Endpoint /metrics (Prometheus) numa thread, em METRICS_HOST:OBINVEST_METRICS_PORT. Com vários processos no
+    host, só o primeiro consegue a porta: nos outros a falha é registrada uma vez e a página segue sem o endpoint.
+    Retorna o servidor, ou None se a porta não pôde ser aberta.
+    """
+    try:
+        srv = ThreadingHTTPServer((METRICS_HOST, int(porta)), _MetricsHandler)
+    except (OSError, ValueError) as e:
+        log_error("metrics_server", e, host=METRICS_HOST, porta=porta)
+        return None
+    threading.Thread(target=srv.serve_forever, name="obinvest-metrics", daemon=True).start()
+    return srv
+
+if METRICS_PORT: start_metrics_server(METRICS_PORT)
+
+# ==============================================================================
+# 2. DADOS E FUNÇÕES DE BUSCA
+# ==============================================================================
+
+# Armazenamento local das séries SGS (Parquet, uma série por arquivo)
+DATA_DIR = os.environ.get("OBINVEST_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".obinvest_data"))
+SGS_DIR = os.path.join(DATA_DIR, "sgs")
+MANIFEST_PATH = os.path.join(SGS_DIR, "manifest.json")
+STORE_LOCK_PATH = os.path.join(SGS_DIR, "store.lock")
+HIST_ANOS = 10
+_store_lock = threading.Lock()
+
+# Motor de busca: uma tarefa por série (ou janela de série diária), com retentativa por tarefa
+SGS_WORKERS = 8
+SGS_RETRIES = 3
+SGS_BACKOFF = 0.5
+SGS_RETRY_AFTER_MAX = 60 # Espera máxima pedida por um 429 que ainda vale a pena cumprir (s)
+SGS_PRAZO = 30.0 # Tempo máximo para baixar uma janela, todas as tentativas e esperas incluídas (s)
+SGS_CHUNK_ANOS = 2
+# Cada delta volta este tanto antes da última observação salva, para trazer revisões (PIB, IGP-M...):
+# as últimas ~4 observações das séries mensais e ~1 semana útil das diárias
+SGS_REVISAO = {"D": pd.offsets.BDay(5), "M": pd.DateOffset(months=3)}
+SGS_API = "https://api.bcb.gov.br/dados/serie/bcdata.sgs.{}/dados"
+_sgs_pausa = {"ate": 0.0} # time.monotonic() até quando o SGS pediu para esperar (429), vale para todas as threads
+_sgs_pausa_lock = threading.Lock()
+
+# Servidor alternativo para as APIs do BCB (ex.: bench/mock_bcb.py, em testes de carga ou sem rede)
+BCB_URL = os.environ.get("OBINVEST_BCB_URL")
+
+# Transporte HTTP do python-bcb: conexões mantidas entre requisições, limites de tempo por requisição
+# e cópia (hedge) da requisição que passar do percentil de latência recente da API. O httpx, como o
+# python-bcb, só é importado quando uma busca vai acontecer (ver bcb_client)
+BCB_CONEXOES = 2 * SGS_WORKERS # Conexões abertas no pool (SGS_WORKERS mantidas vivas por BCB_KEEPALIVE s)
+BCB_KEEPALIVE = 60
+BCB_TIMEOUT = 10.0 # Cada leitura/escrita (s)
+BCB_TIMEOUT_CONEXAO = 3.0
+BCB_PRAZO = 20.0 # Tempo máximo de uma requisição, cópias incluídas (s); quem chama pode pedir menos (obinvest_limite)
+BCB_HEDGE_PCT = 95 # Percentil da latência (obinvest_upstream_seconds) após o qual sai a cópia
+BCB_HEDGE_AMOSTRAS = 20 # Amostras necessárias para confiar no percentil; antes disso vale BCB_HEDGE_PADRAO
+BCB_HEDGE_PADRAO = 2.0
+BCB_HEDGE_MIN = 0.25 # Espera mínima antes da cópia (s)
+BCB_HEDGE_COTA = 0.1 # Fração máxima das requisições que ganham cópia...
+BCB_HEDGE_RAJADA = 5 # ...mais esta folga (uma carga inicial tem poucas requisições)
+_bcb_lock = threading.Lock()
+
+# Os transportes seguem a interface de httpx.BaseTransport (handle_request/close) sem herdar dela,
+# para que o módulo não dependa do httpx ao carregar
+class _BCBRedirect:
+    """
+    Envia as requisições do python-bcb (api.bcb.gov.br e olinda.bcb.gov.br) para BCB_URL pelo transporte
+    `interno`, mantendo caminho e query.
+    """
+    def __init__(self, base, interno):
+        import httpx
+        self.base = httpx.URL(base)
+        self.interno = interno
+
+    def handle_request(self, request):
+        request.url = request.url.copy_with(scheme=self.base.scheme, host=self.base.host, port=self.base.port)
+        request.headers["Host"] = request.url.netloc.decode()
+        return self.interno.handle_request(request)
+
+    def close(self): self.interno.close()
+
+class _BCBHedge:
+    """
+    Envia cada GET pelo transporte `interno` e, se a resposta (corpo incluído) não chegar dentro do percentil
+    BCB_HEDGE_PCT da latência recente da API, manda uma cópia e fica com a que terminar primeiro. As cópias
+    respeitam a cota BCB_HEDGE_COTA (+ BCB_HEDGE_RAJADA); falhas não geram cópia (ficam com as retentativas de quem chamou).
+    A requisição termina em BCB_PRAZO ou no limite (time.monotonic()) da extensão "obinvest_limite", o que vier antes.
+    """
+    def __init__(self, interno):
+        self.interno = interno
+        self.pool = ThreadPoolExecutor(max_workers=2 * BCB_CONEXOES, thread_name_prefix="obinvest-bcb")
+        self.lock = threading.Lock()
+        self.enviadas = self.copias = 0
+
+    def _envia(self, request):
+        resp = self.interno.handle_request(request)
+        try: resp.read() # Devolve a conexão ao pool assim que o corpo chega
+        except Exception: resp.close(); raise
+        return resp
+
+    def _espera(self, api):
+        p = METRICS.percentil("obinvest_upstream_seconds", BCB_HEDGE_PCT, BCB_HEDGE_AMOSTRAS, api=api)
+        return min(max(p if p is not None else BCB_HEDGE_PADRAO, BCB_HEDGE_MIN), BCB_PRAZO)
+
+    def _cota(self):
+        with self.lock:
+            if self.copias >= BCB_HEDGE_COTA * self.enviadas + BCB_HEDGE_RAJADA: return False
+            self.copias += 1
+            return True
+
+    def handle_request(self, request):
+        if request.method != "GET": return self.interno.handle_request(request)
+        api = _bcb_api(request.url)
+        limite = min(time.monotonic() + BCB_PRAZO, request.extensions.get("obinvest_limite", float("inf")))
+        with self.lock: self.enviadas += 1
+        futuros = [self.pool.submit(self._envia, request)]
+        feitos, pendentes = wait(futuros, timeout=max(min(self._espera(api), limite - time.monotonic()), 0))
+        if not feitos and time.monotonic() < limite and self._cota():
+            METRICS.inc("obinvest_upstream_hedges_total", api=api)
+            futuros.append(self.pool.submit(self._envia, request))
+            pendentes = set(futuros)
+        erro = None
+        while True:
+            for fut in feitos:
+                if fut.exception() is None:
+                    if len(futuros) > 1: METRICS.inc("obinvest_upstream_hedge_wins_total", api=api, vencedora="copia" if fut is futuros[1] else "original")
+                    return fut.result()
+                erro = fut.exception()
+            if not pendentes: raise erro
+            feitos, pendentes = wait(pendentes, timeout=max(limite - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not feitos:
+                import httpx
+                raise httpx.ReadTimeout("Sem resposta do BCB dentro do prazo", request=request)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.interno.close()
+
+def bcb_client():
+    """
+    Importa o python-bcb só quando uma busca vai acontecer e prepara o cliente HTTP compartilhado dele:
+    transporte com pool de conexões, limites de tempo e cópias (_BCBHedge), redirecionamento para BCB_URL
+    (se definido) e hooks de medição. Se outro código trocou o cliente (ex.: fixtures do bench, testes), o
+    transporte dele passa a ser o interno, com os mesmos prazos e cópias. Pode ser chamada várias vezes.
+    """
+    import httpx
+    import bcb.http
+    with _bcb_lock:
+        cliente = bcb.http._CLIENT
+        if getattr(cliente, "obinvest_transport", False): return cliente
+        limits = httpx.Limits(max_connections=BCB_CONEXOES, max_keepalive_connections=SGS_WORKERS, keepalive_expiry=BCB_KEEPALIVE)
+        if BCB_URL: interno = _BCBRedirect(BCB_URL, httpx.HTTPTransport(limits=limits))
+        # O cliente padrão do python-bcb usa um HTTPTransport comum: é substituído pelo nosso pool
+        elif type(cliente._transport) is httpx.HTTPTransport: interno = httpx.HTTPTransport(limits=limits)
+        else: interno = cliente._transport
+        cliente = bcb.http._CLIENT = httpx.Client(transport=_BCBHedge(interno), timeout=httpx.Timeout(BCB_TIMEOUT, connect=BCB_TIMEOUT_CONEXAO), follow_redirects=True,
+                                                  event_hooks={"request": [_bcb_request], "response": [_bcb_response]})
+        cliente.obinvest_transport = True
+    return cliente
+
+def _sgs_path(codigo): return os.path.join(SGS_DIR, f"{codigo}.parquet")
+
+def load_manifest():
+    """
+    Lê o manifesto com a data da última observação de cada série armazenada.
+    """
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f: return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def load_series(codigo):
+    """
+    Lê a série armazenada localmente. Retorna uma Series vazia se não existir.
+    """
+    try:
+        return pd.read_parquet(_sgs_path(codigo))["valor"]
+    except Exception:
+        return pd.Series(dtype="float64", name="valor")
+
+def save_series(codigo, serie):
+    """
+    Grava a série (escrita atômica) e registra a última observação no manifesto.
+    As séries sob demanda são gravadas fora do refresh_lock: a gravação e o read-modify-write do manifesto
+    ficam sob flock em STORE_LOCK_PATH (entre processos) e _store_lock (entre threads, e sem fcntl).
+    """
+    os.makedirs(SGS_DIR, exist_ok=True)
+    sufixo = f".{os.getpid()}.{threading.get_ident()}.tmp" # Temporário único por escritor
+    with _store_lock, open(STORE_LOCK_PATH, "a", encoding="utf-8") as trava:
+        if fcntl: fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            tmp = _sgs_path(codigo) + sufixo
+            serie.rename("valor").to_frame().to_parquet(tmp)
+            os.replace(tmp, _sgs_path(codigo))
+
+            manifest = load_manifest()
+            manifest[str(codigo)] = {"last": serie.index.max().strftime("%Y-%m-%d"), "checked": datetime.now().isoformat(timespec="seconds")}
+            tmp = MANIFEST_PATH + sufixo
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=1)
+            os.replace(tmp, MANIFEST_PATH)
+        finally:
+            if fcntl: fcntl.flock(trava, fcntl.LOCK_UN)
+
+def _sgs_chunks(start, end, diaria):
+    """
+    Divide [start, end] em janelas de SGS_CHUNK_ANOS para séries diárias longas.
+    """
+    ini, fim = pd.Timestamp(start), pd.Timestamp(end)
+    if not diaria or (fim - ini).days <= 365 * SGS_CHUNK_ANOS: return [(ini, None)]
+    cortes = list(pd.date_range(ini, fim, freq=pd.DateOffset(years=SGS_CHUNK_ANOS)))
+    # A última janela absorve a sobra curta (evita janelas sem observações)
+    if (fim - cortes[-1]).days < 30: cortes = cortes[:-1]
+    return [(c, cortes[i + 1] - timedelta(days=1) if i + 1 < len(cortes) else None) for i, c in enumerate(cortes)]
+
+def _retry_after(resp):
+    """
+    Segundos pedidos no cabeçalho Retry-After (número ou data HTTP); None se ausente ou inválido.
+    """
+    valor = resp.headers.get("Retry-After")
+    if not valor: return None
+    try: return max(float(valor), 0.0)
+    except ValueError: pass
+    try: return max((parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError): return None
+
+def _sgs_series(dados):
+    """
+    Resposta JSON do SGS ([{"data": "dd/mm/aaaa", "valor": "1.23"}, ...]) como Series float indexada pela data.
+    """
+    return pd.Series(pd.to_numeric([r["valor"] for r in dados], errors="coerce"),
+                     index=pd.to_datetime([r["data"] for r in dados], format="%d/%m/%Y"), dtype="float64", name="valor")
+
+def _fetch_sgs_range(codigo, start, end):
+    """
+    Baixa uma janela de uma série direto da API do SGS, pelo cliente de bcb_client() (a função do python-bcb
+    tem retentativa própria, que se somaria a esta). Só essa janela é refeita em caso de falha: erros de
+    conexão, 5xx e respostas inválidas com backoff exponencial; 429 depois do Retry-After, que pausa também
+    as outras threads. Outros 4xx não são refeitos. Tentativas e esperas, juntas, param em SGS_PRAZO.
+    """
+    import httpx
+    cliente = bcb_client()
+    limite = time.monotonic() + SGS_PRAZO
+    params = {"formato": "json", "dataInicial": start.strftime("%d/%m/%Y"), "dataFinal": (end if end is not None else datetime.today()).strftime("%d/%m/%Y")}
+    def _erro(resp): return httpx.HTTPStatusError(f"SGS {codigo}: status {resp.status_code}", request=resp.request, response=resp)
+    for attempt in range(SGS_RETRIES):
+        espera = SGS_BACKOFF * 2 ** attempt
+        try:
+            # O transporte (_BCBHedge) corta a requisição, cópias incluídas, no prazo da janela
+            resp = cliente.get(SGS_API.format(codigo), params=params, extensions={"obinvest_limite": limite})
+        except httpx.TransportError as e:
+            erro = e
+        else:
+            if resp.status_code == 200:
+                try: return _sgs_series(resp.json())
+                except (ValueError, KeyError, TypeError) as e: erro = e # Página de manutenção ou JSON de erro
+            elif resp.status_code == 429:
+                erro, pedido = _erro(resp), _retry_after(resp) or 0
+                if pedido > SGS_RETRY_AFTER_MAX: raise erro
+                espera = max(espera, pedido)
+                with _sgs_pausa_lock: _sgs_pausa["ate"] = max(_sgs_pausa["ate"], time.monotonic() + espera)
+            elif resp.status_code >= 500: erro = _erro(resp)
+            else: raise _erro(resp)
+        # Próxima tentativa depois do backoff ou da pausa pedida por um 429 (desta ou de outra thread), se couber no prazo
+        espera = max(espera, _sgs_pausa["ate"] - time.monotonic())
+        if attempt == SGS_RETRIES - 1 or time.monotonic() + espera >= limite: raise erro
+        METRICS.inc("obinvest_upstream_retries_total", api="sgs")
+        time.sleep(espera)
+
+def update_series(codigos, start):
+    """
+    Atualiza várias séries em paralelo: busca no SGS apenas o delta desde um pouco antes da última
+    observação armazenada (SGS_REVISAO) e mescla ao histórico local, com os valores novos substituindo
+    os revisados. Se o histórico local não cobre o início pedido,
+    baixa a série completa a partir de `start`, em janelas paralelas no caso das diárias.
+    Retorna {codigo: Series}; séries que falham sem histórico local ficam de fora.
+    """
+    bcb_client()
+    manifest = load_manifest()
+    hoje = datetime.today()
+    planos, tarefas = {}, []
+    for codigo in codigos:
+        local = load_series(codigo)
+        ultimo = manifest.get(str(codigo), {}).get("last")
+        # Séries mensais começam até ~1 mês depois de `start`
+        cobre_inicio = not local.empty and local.index.min() <= pd.Timestamp(start) + timedelta(days=35)
+        revisao = SGS_REVISAO["D" if codigo in SGS_DIARIAS else "M"]
+        inicio = max(pd.Timestamp(ultimo) - revisao, pd.Timestamp(start)) if (ultimo and cobre_inicio) else start
+        planos[codigo] = (local, cobre_inicio)
+        tarefas += [(codigo, ini, fim) for ini, fim in _sgs_chunks(inicio, hoje, codigo in SGS_DIARIAS)]
+
+    partes, falhas = {}, set()
+    with timed("sgs_fetch"), ThreadPoolExecutor(max_workers=min(SGS_WORKERS, len(tarefas))) as pool:
+        futuros = {pool.submit(_fetch_sgs_range, *t): t[0] for t in tarefas}
+        for fut in as_completed(futuros):
+            codigo = futuros[fut]
+            try: partes.setdefault(codigo, []).append(fut.result())
+            except Exception as e:
+                log_error("sgs", e, codigo=codigo)
+                METRICS.inc("obinvest_upstream_failures_total", api="sgs")
+                falhas.add(codigo)
+
+    res = {}
+    for codigo, (local, cobre_inicio) in planos.items():
+        if codigo in falhas:
+            # Sem conexão: segue com o que já está salvo
+            if cobre_inicio: res[codigo] = local
+            continue
+        novo = pd.concat(partes[codigo]).rename("valor").sort_index()
+        if novo.empty:
+            # Nada publicado no período pedido: segue com o que já está salvo
+            if cobre_inicio: res[codigo] = local
+            continue
+        # A janela de revisão volta com o delta: valores revisados substituem os antigos
+        serie = pd.concat([local[local.index < novo.index.min()], novo]) if cobre_inicio else novo
+        serie = serie[~serie.index.duplicated(keep="last")].sort_index()
+        with timed("sgs_store"): save_series(codigo, serie)
+        res[codigo] = serie
+    return res
+
+# ==============================================================================
+# REGISTRO DE SÉRIES SGS
+# ==============================================================================
+# nome: código SGS, frequência (D diária, M mensal), unidade, cor, transformação (TRANSFORMACOES) e rótulo.
+# As séries com "base" formam o snapshot (cards, gráficos principais, tabela e calculadora) e são
+# atualizadas pelo refresher; as demais só são buscadas quando uma visão pede (ver `get_series`).
+SERIES = {
+    "Selic": {"codigo": 432, "freq": "D", "unidade": "% a.a.", "cor": C_SELIC, "rotulo": "Taxa Selic (meta)", "base": True},
+    "IPCA": {"codigo": 13522, "freq": "M", "unidade": "% 12M", "cor": C_IPCA, "rotulo": "IPCA (12M)", "base": True},
+    "IGPM": {"codigo": 13521, "freq": "M", "unidade": "% 12M", "cor": C_IGPM, "rotulo": "IGP-M (12M)", "base": True},
+    "Dolar": {"codigo": 1, "freq": "D", "unidade": "R$", "cor": C_DOLAR, "rotulo": "Dólar PTAX (venda)", "base": True},
+    # PIB Mensal (R$ Milhões) - Série oficial de valores correntes
+    "PIB_Mensal_Raw": {"codigo": 4380, "freq": "M", "unidade": "R$ milhões", "cor": C_PIB, "rotulo": "PIB mensal (valores correntes)", "base": True},
+    # Variação mensal do IPCA: a calculadora capitaliza mês a mês com ela (o IPCA 12M não é uma taxa mensal)
+    "IPCA_Mensal": {"codigo": 433, "freq": "M", "unidade": "% no mês", "cor": C_IPCA, "rotulo": "IPCA (variação mensal)", "base": True},
+    # Sob demanda
+    "CDI": {"codigo": 4389, "freq": "D", "unidade": "% a.a.", "cor": C_SELIC, "rotulo": "CDI (anualizado, base 252)"},
+    "IPCA_Alimentacao": {"codigo": 1635, "freq": "M", "unidade": "% 12M", "cor": C_IPCA, "rotulo": "IPCA - Alimentação e bebidas (12M)", "transform": "acum_12m"},
+    "IPCA_Servicos": {"codigo": 10844, "freq": "M", "unidade": "% 12M", "cor": C_IPCA, "rotulo": "IPCA - Serviços (12M)", "transform": "acum_12m"},
+    "INPC": {"codigo": 188, "freq": "M", "unidade": "% 12M", "cor": C_IGPM, "rotulo": "INPC (12M)", "transform": "acum_12m"},
+    "Desocupacao": {"codigo": 24369, "freq": "M", "unidade": "%", "cor": C_REAL, "rotulo": "Taxa de desocupação (PNAD Contínua)"},
+    "IBC_Br": {"codigo": 24364, "freq": "M", "unidade": "índice", "cor": C_PIB, "rotulo": "IBC-Br (dessazonalizado)"},
+    "DLSP_PIB": {"codigo": 4513, "freq": "M", "unidade": "% PIB", "cor": C_SELIC, "rotulo": "Dívida líquida do setor público (% PIB)"},
+    "DBGG_PIB": {"codigo": 13762, "freq": "M", "unidade": "% PIB", "cor": C_SELIC, "rotulo": "Dívida bruta do governo geral (% PIB)"},
+}
+
+# Transformações aplicadas à série do SGS antes do recorte (variações mensais em % -> acumulado)
+TRANSFORMACOES = {
+    "acum_12m": lambda s: (np.exp(np.log1p(s / 100).rolling(12).sum()) - 1) * 100,
+}
+
+SGS_CODIGOS = {nome: cfg["codigo"] for nome, cfg in SERIES.items() if cfg.get("base")}
+SGS_DIARIAS = {cfg["codigo"] for cfg in SERIES.values() if cfg["freq"] == "D"}
+
+def _transforma(nome, s):
+    f = SERIES[nome].get("transform")
+    return TRANSFORMACOES[f](s).dropna() if f else s
+
+def get_data(offline=False, prev=None):
+    """
+    Busca dados históricos do SGS (Série Histórica/Passado).
+    Usa o histórico salvo em disco e baixa só as observações novas, uma série por thread.
+    Com `offline=True` monta o conjunto apenas com o que está em disco, sem acessar a rede.
+    `prev` é o conjunto da versão anterior: os indicadores derivados só recalculam o trecho novo.
+
+    Retorna {nome: Series float32} com cada série na sua frequência nativa (diária ou mensal), mais os
+    indicadores de DERIVADOS; o alinhamento entre séries fica para as visões que precisam delas juntas (ver `align`).
+    """
+    try:
+        hoje = datetime.today()
+        start = pd.Timestamp(hoje - timedelta(days=365*HIST_ANOS)).normalize()
+        
+        if offline:
+            series = {cod: load_series(cod) for cod in SGS_CODIGOS.values()}
+            series = {cod: s for cod, s in series.items() if not s.empty}
+        else:
+            series = update_series(SGS_CODIGOS.values(), start)
+        if any(cod not in series for cod in SGS_CODIGOS.values()): return {}
+        ds = {nome: _transforma(nome, series[cod]) for nome, cod in SGS_CODIGOS.items()}
+        
+        # Indicadores derivados (PIB 12M, juro real...), sobre as séries completas, antes do recorte
+        with timed("derivados"): ds = derive(ds, prev)
+        
+        return {nome: s[s.index >= start].astype("float32").rename(nome) for nome, s in ds.items()}
+    except Exception as e:
+        log_error("get_data", e)
+        return {}
+
+# Copy-on-write (padrão a partir do pandas 3): recortes e colunas derivadas das séries compartilhadas
+# viram cópias só quando alterados, sem nunca escrever no snapshot
+if int(pd.__version__.split(".")[0]) < 3: pd.set_option("mode.copy_on_write", True)
+
+def freeze_dataset(ds):
+    """
+    Torna o conjunto de séries imutável para ser lido por todas as sessões do processo sem cópias:
+    cada série passa a apontar para um buffer NumPy somente leitura e o dicionário não aceita escrita.
+    Quem precisa alterar dados trabalha numa cópia (ex.: o DataFrame de `align`); escrever direto numa
+    série do snapshot levanta ValueError em vez de corromper o que as outras sessões estão vendo.
+    """
+    frozen = {}
+    for nome, s in ds.items():
+        v = s.to_numpy(copy=True)
+        v.setflags(write=False)
+        frozen[nome] = pd.Series(v, index=s.index, name=s.name, copy=False)
+    return MappingProxyType(frozen)
+
+def align(ds, nomes, ini=None, fim=None):
+    """
+    Junta séries de frequências diferentes no calendário da mais frequente, só quando uma visão
+    precisa delas lado a lado. As menos frequentes repetem o último valor (forward-fill).
+    """
+    with timed("align"):
+        base = max(nomes, key=lambda n: len(ds[n]))
+        df = pd.concat({n: ds[n] for n in nomes}, axis=1).sort_index().ffill().reindex(ds[base].index)
+        if ini is not None: df = df.loc[pd.Timestamp(ini):None if fim is None else pd.Timestamp(fim)]
+        return df.dropna()
+
+# ==============================================================================
+# INDICADORES DERIVADOS
+# ==============================================================================
+# nome: (séries de origem, cálculo sobre o DataFrame alinhado delas, janela anterior de que o cálculo precisa)
+# Calculados uma vez por versão dos dados, fora das páginas, na ordem abaixo (um derivado pode usar outro)
+DERIVADOS = {
+    # Acumulado em 12 meses (R$ Milhões), usado no gráfico do PIB
+    "PIB_12M": (["PIB_Mensal_Raw"], lambda d: d["PIB_Mensal_Raw"].rolling(12).sum(), pd.DateOffset(months=12)),
+    # Variação do PIB acumulado em 12 meses sobre os 12 meses anteriores (%)
+    "PIB_YoY": (["PIB_12M"], lambda d: d["PIB_12M"].pct_change(12, fill_method=None) * 100, pd.DateOffset(months=13)),
+    # Juro real ex-post: Selic deflacionada pelo IPCA 12M (%), no calendário diário da Selic
+    "Juro_Real": (["Selic", "IPCA"], lambda d: ((1 + d["Selic"]/100) / (1 + d["IPCA"]/100) - 1) * 100, pd.DateOffset(months=2)),
+    # Diferença Selic - IPCA 12M (p.p.)
+    "Spread_Selic_IPCA": (["Selic", "IPCA"], lambda d: d["Selic"] - d["IPCA"], pd.DateOffset(months=2)),
+    # Variação do dólar sobre a última cotação de um ano antes (%)
+    "Dolar_YoY": (["Dolar"], lambda d: (d["Dolar"] / d["Dolar"].reindex(d.index - pd.DateOffset(years=1), method="ffill").to_numpy() - 1) * 100, pd.DateOffset(years=1, days=10)),
+    # Média móvel de 21 pregões (~1 mês) do dólar
+    "Dolar_MM21": (["Dolar"], lambda d: d["Dolar"].rolling(21).mean(), pd.DateOffset(months=2)),
+}
+
+def _inicio_mudanca(novo, velho):
+    """
+    Primeira data a partir do início de `velho` em que `novo` difere dele (observação nova, revisada
+    ou removida), comparando em float32 como no snapshot. None se não mudou nada.
+    """
+    novo = novo[novo.index >= velho.index[0]].astype("float32")
+    a, b = novo.align(velho)
+    diff = ~((a == b) | (a.isna() & b.isna()))
+    return diff.idxmax() if diff.any() else None
+
+def derive(ds, prev=None):
+    """
+    Acrescenta a `ds` os indicadores de DERIVADOS. Com `prev` (conjunto da versão anterior), cada indicador
+    reaproveita o histórico já calculado e só recalcula a partir da primeira observação nova ou revisada das
+    séries de origem, mais a janela do cálculo; sem `prev` (ou sem histórico comparável), calcula tudo.
+    """
+    ds = dict(ds)
+    for nome, (origens, calc, janela) in DERIVADOS.items():
+        ini = pd.Timestamp.min
+        if prev is not None and nome in prev and all(o in prev and len(prev[o]) for o in origens):
+            mudancas = [d for d in (_inicio_mudanca(ds[o], prev[o]) for o in origens) if d is not None]
+            if not mudancas:
+                ds[nome] = prev[nome]
+                continue
+            ini = min(mudancas)
+        if ini == pd.Timestamp.min:
+            ds[nome] = calc(align(ds, origens)).dropna().rename(nome)
+        else:
+            novo = calc(align(ds, origens, ini - janela)).dropna()
+            ds[nome] = pd.concat([prev[nome][prev[nome].index < ini], novo[novo.index >= ini]]).rename(nome)
+        METRICS.inc("obinvest_derived_total", indicator=nome, mode="full" if ini == pd.Timestamp.min else "incremental")
+    return ds
+
+SERIES_FALHA_TTL = 60 # Uma busca sob demanda que falhou é refeita depois disso (s)
+
+@contextmanager
+def series_lock(codigo):
+    """
+    Trava de uma série entre os processos do host (flock em SGS_DIR/<código>.lock): uma busca sob demanda
+    por vez. Sem fcntl (Windows) não trava entre processos; dentro do processo vale `request_series`.
+    """
+    os.makedirs(SGS_DIR, exist_ok=True)
+    with open(os.path.join(SGS_DIR, f"{codigo}.lock"), "a", encoding="utf-8") as f:
+        with timed("series_lock"):
+            if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+        try: yield
+        finally:
+            if fcntl: fcntl.flock(f, fcntl.LOCK_UN)
+
+def _atualizada_desde(codigo, version):
+    """
+    True se o manifesto mostra a série verificada no SGS depois da versão dos dados (início do snapshot).
+    """
+    try: return datetime.fromisoformat(load_manifest()[str(codigo)]["checked"]) >= datetime.fromisoformat(version).replace(microsecond=0)
+    except (KeyError, TypeError, ValueError): return False
+
+@instrumented_cache(st.cache_resource, show_spinner=False, max_entries=64)
+def get_series(nome, version):
+    """
+    Série do registro fora do snapshot, buscada só quando uma visão pede: usa o histórico em disco e baixa
+    apenas o delta, uma vez por série e versão dos dados no host (o refresh não toca nessas séries). Os
+    processos esperam na trava da série; quem chega depois de outro ter buscado para esta versão só lê o disco.
+    Retorna a Series float32 somente leitura. Levanta RuntimeError se o SGS falhar sem histórico local,
+    para que a falha não fique no cache. As páginas chamam por `request_series`, fora da renderização.
+    """
+    codigo = SERIES[nome]["codigo"]
+    start = pd.Timestamp(datetime.today() - timedelta(days=365*HIST_ANOS)).normalize()
+    with series_lock(codigo):
+        if _atualizada_desde(codigo, version): s = load_series(codigo)
+        else: s = update_series([codigo], start).get(codigo)
+    if s is None or s.empty: raise RuntimeError(f"SGS {codigo} indisponível e sem histórico local")
+    s = _transforma(nome, s)
+    return freeze_dataset({nome: s[s.index >= start].astype("float32").rename(nome)})[nome]
+
+@st.cache_resource(show_spinner=False)
+def series_jobs():
+    """
+    Buscas sob demanda do processo: {(nome, versão): (Future, início)} e as threads que as executam.
+    """
+    return {"pool": ThreadPoolExecutor(max_workers=2, thread_name_prefix="obinvest-series"), "jobs": {}, "lock": threading.Lock()}
+
+def request_series(nome, version):
+    """
+    Future com get_series(nome, version), buscada numa thread: várias sessões pedindo a mesma série esperam
+    a mesma busca. Uma busca que falhou é disparada de novo depois de SERIES_FALHA_TTL.
+    """
+    reg = series_jobs()
+    with reg["lock"]:
+        job = reg["jobs"].get((nome, version))
+        if job is None or (job[0].done() and job[0].exception() is not None and time.monotonic() - job[1] > SERIES_FALHA_TTL):
+            # Buscas de versões anteriores não servem mais
+            reg["jobs"] = {k: v for k, v in reg["jobs"].items() if k[1] == version}
+            job = reg["jobs"][(nome, version)] = (reg["pool"].submit(get_series, nome, version), time.monotonic())
+    return job[0]
+
+@st.cache_resource(show_spinner=False)
+def get_focus_api():
+    """
+    Cliente OData do Focus. O $metadata é baixado uma vez por processo.
+    """
+    from bcb import Expectativas
+    bcb_client()
+    return Expectativas()
+
+def _focus_ipca(em, dt_lim):
+    """
+    Última mediana do IPCA 12M: ordenação e limite aplicados no servidor (1 linha).
+    """
+    ep = em.get_endpoint('ExpectativasMercadoInflacao12Meses')
+    return (ep.query()
+            .filter(ep.Data >= dt_lim, ep.Suavizada == 'S', ep.baseCalculo == 0)
+            .select(ep.Data, ep.Mediana)
+            .orderby(ep.Data.desc())
+            .limit(1)
+            .collect())
+
+def _focus_pib(em, dt_lim, ano):
+    """
+    Última mediana do PIB Total para o ano corrente ou, na falta dele, o próximo.
+    A preferência sai da ordenação por DataReferencia, numa única consulta de 1 linha.
+    """
+    ep = em.get_endpoint('ExpectativasMercadoAnuais')
+    return (ep.query()
+            .filter(ep.Indicador == 'PIB Total', ep.Data >= dt_lim, ep.baseCalculo == 0)
+            .filter((ep.DataReferencia == str(ano)) | (ep.DataReferencia == str(ano + 1)))
+            .select(ep.Data, ep.DataReferencia, ep.Mediana)
+            .orderby(ep.DataReferencia.asc(), ep.Data.desc())
+            .limit(1)
+            .collect())
+
+def focus_vazio():
+    return {"IPCA": 0.0, "PIB": 0.0, "Data_PIB": "-", "Ref_Year": datetime.now().year}
+
+def get_focus_data():
+    """
+    Busca a projeção do FOCUS para o IPCA 12M e o PIB Total do ano corrente.
+    As duas consultas rodam em paralelo e trazem só as colunas e linhas usadas nos cards.
+    """
+    res = focus_vazio()
+    
+    try:
+        em = get_focus_api()
+        
+        # Datas
+        hoje = datetime.now()
+        dt_lim = (hoje - timedelta(days=30)).date() # 30 dias é suficiente
+        
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            fut_ipca = pool.submit(_focus_ipca, em, dt_lim)
+            fut_pib = pool.submit(_focus_pib, em, dt_lim, hoje.year)
+            df_ipca, df_pib = fut_ipca.result(), fut_pib.result()
+                   
+        # 1. IPCA (ExpectativasMercadoInflacao12Meses)
+        if not df_ipca.empty:
+            res["IPCA"] = float(df_ipca.iloc[0]['Mediana'])
+
+        # 2. PIB (ExpectativasMercadoAnuais -> PIB Total)
+        if not df_pib.empty:
+            ultimo = df_pib.iloc[0]
+            res["PIB"] = float(ultimo['Mediana'])
+            res["Data_PIB"] = pd.to_datetime(ultimo['Data']).strftime('%d/%m')
+            res["Ref_Year"] = int(ultimo['DataReferencia'])
+
+        return res
+
+    except Exception as e:
+        log_error("focus", e)
+        METRICS.inc("obinvest_upstream_failures_total", api="focus")
+        return res
+
+# ==============================================================================
+# ARQUIVO LOCAL DO FOCUS (HISTÓRICO DAS EXPECTATIVAS)
+# ==============================================================================
+# Publicações das expectativas anuais em SQLite, só com acréscimos e chave (Indicador, DataReferencia, Data).
+# Cada atualização busca só o que saiu desde a última publicação gravada; a carga inicial acontece uma vez.
+# Os gráficos consultam o arquivo local, sem ir ao Olinda.
+
+FOCUS_DB_PATH = os.path.join(DATA_DIR, "focus.sqlite")
+FOCUS_INDICADORES = ["IPCA", "PIB Total", "Selic", "Câmbio"]
+FOCUS_HIST_ANOS = 5 # Período da carga inicial
+FOCUS_JANELA_DIAS = 365 # Uma consulta ao Olinda por janela na carga inicial
+
+def focus_db():
+    """
+    Conexão com o arquivo do Focus (uma por uso: conexões sqlite3 não são compartilhadas entre threads).
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    con = sqlite3.connect(FOCUS_DB_PATH, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL") # Leituras das páginas não esperam pela gravação
+    con.execute("CREATE TABLE IF NOT EXISTS focus_anual (Indicador TEXT NOT NULL, DataReferencia TEXT NOT NULL, Data TEXT NOT NULL, Mediana REAL, "
+                "PRIMARY KEY (Indicador, DataReferencia, Data)) WITHOUT ROWID")
+    con.execute("CREATE INDEX IF NOT EXISTS focus_anual_data ON focus_anual (Data)")
+    return con
+
+def update_focus_archive():
+    """
+    Acrescenta ao arquivo as expectativas anuais de FOCUS_INDICADORES publicadas desde a última gravada
+    (inclusive: INSERT OR IGNORE descarta o que já existe). Com o arquivo vazio faz a carga inicial de
+    FOCUS_HIST_ANOS anos, uma janela por transação: uma carga interrompida continua de onde parou.
+    Retorna o número de publicações novas.
+    """
+    ep = get_focus_api().get_endpoint('ExpectativasMercadoAnuais')
+    indicadores = functools.reduce(operator.or_, (ep.Indicador == i for i in FOCUS_INDICADORES))
+    hoje = datetime.now().date()
+    novas = 0
+    with closing(focus_db()) as con:
+        ultima = con.execute("SELECT MAX(Data) FROM focus_anual").fetchone()[0]
+        ini = datetime.fromisoformat(ultima).date() if ultima else hoje - timedelta(days=365*FOCUS_HIST_ANOS)
+        while ini <= hoje:
+            fim = min(ini + timedelta(days=FOCUS_JANELA_DIAS), hoje + timedelta(days=1))
+            df = (ep.query()
+                  .filter(indicadores, ep.Data >= ini, ep.Data < fim, ep.baseCalculo == 0)
+                  .select(ep.Indicador, ep.DataReferencia, ep.Data, ep.Mediana)
+                  .collect())
+            if not df.empty:
+                linhas = zip(df["Indicador"], df["DataReferencia"].astype(str), pd.to_datetime(df["Data"]).dt.strftime("%Y-%m-%d"), df["Mediana"].astype(float))
+                with con:
+                    antes = con.total_changes
+                    con.executemany("INSERT OR IGNORE INTO focus_anual VALUES (?, ?, ?, ?)", linhas)
+                    novas += con.total_changes - antes
+            ini = fim
+    return novas
+
+def focus_state():
+    """
+    Estado do arquivo (última publicação, linhas), chave dos gráficos do Focus. None com o arquivo vazio.
+    """
+    with closing(focus_db()) as con: ultima, n = con.execute("SELECT MAX(Data), COUNT(*) FROM focus_anual").fetchone()
+    return (ultima, n) if n else None
+
+def focus_history(indicador):
+    """
+    Evolução das medianas de um indicador no arquivo local: DataFrame indexado pela data da publicação,
+    uma coluna por ano de referência (do ano anterior ao da última publicação até três à frente).
+    """
+    with closing(focus_db()) as con:
+        df = pd.read_sql_query("SELECT DataReferencia, Data, Mediana FROM focus_anual WHERE Indicador = ?", con, params=(indicador,), parse_dates=["Data"])
+    if df.empty: return df
+    ano = df["Data"].max().year
+    df = df[df["DataReferencia"].astype(int).between(ano - 1, ano + 3)]
+    return df.pivot(index="Data", columns="DataReferencia", values="Mediana").sort_index()
+
+# ==============================================================================
+# GRÁFICOS: REDUÇÃO DE PONTOS (LTTB) E WEBGL
+# ==============================================================================
+
+CHART_MAX_PONTOS = 1000 # ~ largura do gráfico em pixels
+CHART_GL_PONTOS = 1500 # Janelas mais longas que isso usam Scattergl (WebGL)
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: escolhe n_out pontos que preservam picos e vales.
+    Mantém o primeiro e o último ponto; em cada bucket fica o ponto que forma o maior triângulo
+    com o ponto escolhido no bucket anterior e a média do bucket seguinte. Retorna os índices.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3: return np.arange(n)
+    x = np.asarray(x, dtype=np.float64); y = np.asarray(y, dtype=np.float64)
+    bordas = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64); idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = bordas[i], bordas[i + 1]
+        prox = slice(hi, bordas[i + 2] if i + 2 < len(bordas) else n)
+        mx, my = x[prox].mean(), y[prox].mean()
+        area = np.abs((x[a] - mx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (my - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+def series_trace(s, **kw):
+    """
+    Trace de uma série já recortada no período escolhido, com no máximo CHART_MAX_PONTOS pontos.
+    Como a redução é feita depois do recorte, períodos menores mostram mais detalhe.
+    """
+    import plotly.graph_objects as go
+    n = len(s)
+    if n > CHART_MAX_PONTOS: s = s.iloc[lttb(s.index.asi8, s.to_numpy(), CHART_MAX_PONTOS)]
+    return (go.Scattergl if n > CHART_GL_PONTOS else go.Scatter)(x=s.index, y=s.to_numpy(), **kw)
+
+# ==============================================================================
+# GRÁFICOS E TABELA (CACHE POR VERSÃO DOS DADOS)
+# ==============================================================================
+# Figuras e tabelas ficam em st.cache_resource (sem cópia/pickle), compartilhadas entre reruns
+# e sessões. A chave inclui a versão do snapshot, então uma atualização dos dados invalida tudo.
+
+# Séries usadas por cada gráfico
+CHART_SERIES = {
+    "Geral": ["Selic", "IPCA"],
+    "Juro Real": ["Juro_Real"],
+    "PIB": ["PIB_12M"],
+}
+TABLE_SERIES = ["Selic", "IPCA", "Dolar", "IGPM"]
+
+@instrumented_cache(st.cache_resource, show_spinner=False, max_entries=64)
+def build_chart(version, chart_type, d_ini, d_fim, _ds):
+    """
+    Figura do gráfico histórico para (versão dos dados, gráfico, período). None se o período não tem dados.
+    """
+    import plotly.graph_objects as go
+    df_chart = align(_ds, CHART_SERIES.get(chart_type, [chart_type]), d_ini, d_fim)
+    if df_chart.empty: return None
+    fig = go.Figure()
+    
+    if chart_type == "Geral":
+        from plotly.subplots import make_subplots
+        fig = make_subplots(specs=[[{"secondary_y": False}]])
+        fig.add_trace(series_trace(df_chart["Selic"], name="Selic", line=dict(color=C_SELIC, width=3)))
+        fig.add_trace(series_trace(df_chart["IPCA"], name="IPCA", line=dict(color=C_ACCENT, width=3)))
+        fig.update_yaxes(title_text="Taxa (%)", ticksuffix="%")
+    elif chart_type == "Selic": 
+        fig.add_trace(series_trace(df_chart["Selic"], name="Selic", line=dict(color=C_SELIC, width=4)))
+        fig.update_yaxes(ticksuffix="%")
+    elif chart_type == "IPCA": 
+        fig.add_trace(series_trace(df_chart["IPCA"], name="IPCA", line=dict(color=C_IPCA, width=4)))
+        fig.update_yaxes(ticksuffix="%")
+    elif chart_type == "Juro Real": 
+        fig.add_trace(series_trace(df_chart["Juro_Real"], name="Juro Real", line=dict(color=C_REAL, width=3)))
+        fig.update_yaxes(ticksuffix="%")
+    elif chart_type == "Dolar": 
+        fig.add_trace(series_trace(df_chart["Dolar"], name="Dólar", fill='tozeroy', line=dict(color=C_DOLAR, width=2)))
+        fig.update_yaxes(tickprefix="R$ ")
+    elif chart_type == "IGPM": 
+        fig.add_trace(series_trace(df_chart["IGPM"], name="IGP-M", fill='tozeroy', line=dict(color=C_IGPM, width=2)))
+        fig.update_yaxes(ticksuffix="%", autorange=True)
+        
+    elif chart_type == "PIB":
+        # ==========================================
+        # GRÁFICO: APENAS HISTÓRICO (ACUMULADO 12M)
+        # ==========================================
+        # Usa a série calculada PIB_12M (R$ Milhões) e converte para Trilhões
+        df_pib = df_chart["PIB_12M"] / 1_000_000
+        fig.add_trace(series_trace(
+            df_pib, 
+            name="PIB (12 Meses)", 
+            fill='tozeroy', 
+            line=dict(color=C_PIB, width=3)
+        ))
+
+        fig.update_layout(
+            showlegend=False, 
+            yaxis=dict(title="PIB Nominal (R$ Trilhões)", tickprefix="R$ ", showgrid=True),
+            xaxis=dict(title="Mês de Referência"),
+            hovermode="x unified"
+        )
+        return fig
+    
+    fig.update_layout(template="plotly_white", height=350, margin=dict(t=30, l=10, r=10, b=10), hovermode="x unified", xaxis=dict(showgrid=False), yaxis=dict(showgrid=True, gridcolor="#E2E8F0"))
+    return fig
+
+# Unidade de cada indicador do Focus no gráfico de expectativas: (prefixo, sufixo)
+FOCUS_UNIDADES = {"IPCA": ("", "%"), "PIB Total": ("", "%"), "Selic": ("", "%"), "Câmbio": ("R$ ", "")}
+
+@instrumented_cache(st.cache_resource, show_spinner=False, max_entries=16)
+def build_focus_chart(focus_version, indicador):
+    """
+    Figura da evolução das expectativas do Focus para o indicador, uma linha por ano de referência.
+    Lida do arquivo local uma vez por estado do arquivo (DataRefresher.focus_version). None se o arquivo
+    ainda não tem o indicador (a carga inicial roda depois da publicação do snapshot).
+    """
+    import plotly.graph_objects as go
+    hist = focus_history(indicador)
+    if hist.empty: return None
+    fig = go.Figure()
+    for ref in hist.columns: fig.add_trace(series_trace(hist[ref].dropna(), name=ref, line=dict(width=2)))
+    pre, suf = FOCUS_UNIDADES[indicador]
+    fig.update_layout(template="plotly_white", height=350, margin=dict(t=30, l=10, r=10, b=10), hovermode="x unified",
+                      xaxis=dict(showgrid=False, title="Data da Publicação"), yaxis=dict(showgrid=True, gridcolor="#E2E8F0", tickprefix=pre, ticksuffix=suf),
+                      legend=dict(title="Ano de referência", orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+    return fig
+
+@instrumented_cache(st.cache_resource, show_spinner=False, max_entries=64)
+def build_series_chart(version, nome, _s):
+    """
+    Figura do histórico de uma série do registro carregada sob demanda (cor e unidade do registro).
+    """
+    import plotly.graph_objects as go
+    s = _s
+    cfg = SERIES[nome]
+    fig = go.Figure(series_trace(s, name=cfg["rotulo"], line=dict(color=cfg["cor"], width=3)))
+    fig.update_layout(template="plotly_white", height=350, margin=dict(t=30, l=10, r=10, b=10), hovermode="x unified", xaxis=dict(showgrid=False),
+                      yaxis=dict(showgrid=True, gridcolor="#E2E8F0", title=cfg["unidade"], tickprefix="R$ " if cfg["unidade"].startswith("R$") else "",
+                                 ticksuffix="%" if cfg["unidade"].startswith("%") else ""))
+    return fig
+
+# Cor das setas na tabela: alta, baixa, estável
+CSS_SETAS = ["color: #10B981; font-weight:600", "color: #EF4444; font-weight:600", "color: #64748B"]
+
+@instrumented_cache(st.cache_resource, show_spinner=False, max_entries=4)
+def get_monthly_table(version, _ds):
+    """
+    Fechamento mensal das séries da tabela (mais recente primeiro), formatado para exibição com a seta
+    de variação sobre o mês anterior. Montado uma vez por versão, com operações vetoriais sobre todo o
+    histórico; a paginação só recorta. Retorna (textos, estilos CSS), DataFrames com o mesmo índice.
+    """
+    # Cada série no seu calendário de divulgação: o mês corrente ainda sem IPCA/IGP-M repete o último valor
+    # publicado, e os meses anteriores ao início de alguma série ficam de fora
+    with timed("resample_mensal"): df_rev = pd.concat({c: _ds[c].resample('M').last() for c in TABLE_SERIES}, axis=1).sort_index().ffill().dropna().iloc[::-1]
+    show, css = {}, {}
+    for c in TABLE_SERIES:
+        v = df_rev[c].to_numpy(np.float64)
+        d = df_rev[c].diff(-1).to_numpy()
+        pre, suf = ("R$ ", " ") if c == "Dolar" else (" ", "% ")
+        show[c] = np.char.add(np.char.add(pre, np.char.mod("%.4f", v)), np.char.add(suf, np.select([d > 0, d < 0], ["▲", "▼"], "=")))
+        css[c] = np.select([d > 0, d < 0], CSS_SETAS[:2], CSS_SETAS[2])
+    return pd.DataFrame(show, index=df_rev.index), pd.DataFrame(css, index=df_rev.index)
+
+# ==============================================================================
+# PROJEÇÕES DA CALCULADORA
+# ==============================================================================
+
+MC_PATHS = 50_000 # Trajetórias simuladas
+MC_BLOCO = 12 # Meses por bloco do bootstrap (preserva sazonalidade e persistência)
+MC_PONTOS = 60 # Pontos do leque (percentis) por indexador
+
+def monthly_rates(ds):
+    """
+    Taxas mensais (fração) de Selic e IPCA, lado a lado por mês: a Selic (% a.a.) é convertida para o mês e o
+    IPCA é a variação do próprio mês (SGS 433), não o acumulado em 12 meses.
+    """
+    with timed("resample_mensal"): m = pd.concat({"Selic": ds["Selic"].resample('M').mean(), "IPCA": ds["IPCA_Mensal"].resample('M').last()}, axis=1).dropna().astype("float64")
+    return pd.DataFrame({"Selic": (1 + m["Selic"] / 100) ** (1/12) - 1, "IPCA": m["IPCA"] / 100})
+
+def _blocos(r, L):
+    """
+    Fatores acumulados de cada janela de L meses do histórico: G[s, j] = Π(1 + r[s..s+j]) e S[s, j] = Σ 1/G[s, ..j].
+    Com eles o saldo após j+1 meses de um bloco iniciado em s é G[s, j] * (saldo_inicial + aporte * S[s, j]).
+    """
+    G = np.cumprod(1 + np.lib.stride_tricks.sliding_window_view(r, L), axis=1)
+    return G, np.cumsum(1 / G, axis=1)
+
+def simulate_paths(hist, ini, mes, anos, pct, fx, pre, n=MC_PATHS, bloco=MC_BLOCO, seed=7):
+    """
+    Monte Carlo por bootstrap em blocos do histórico mensal (Selic e IPCA sorteados juntos, mantendo a correlação).
+    Simula as n trajetórias dos três indexadores de uma vez, bloco a bloco, com operações vetoriais.
+    Retorna (meses, {"CDI"|"IPCA"|"Pré": array 3 x len(meses) com P5/P50/P95 do saldo}).
+    """
+    T = anos * 12
+    L = min(bloco, len(hist))
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, len(hist) - L + 1, size=(-(-T // L), n))
+    passo = max(1, -(-T // MC_PONTOS))
+    meses = np.unique(np.r_[0, np.arange(passo, T + 1, passo), T])
+
+    taxas = {"CDI": hist[:, 0] * pct / 100, "IPCA": (1 + hist[:, 1]) * (1 + fx / 100) ** (1/12) - 1}
+    res = {}
+    for k, r in taxas.items():
+        G, S = _blocos(r, L)
+        saldo = np.full(n, float(ini)); pontos = [saldo]
+        for b, s in enumerate(starts):
+            m0 = b * L
+            for m in meses[(meses > m0) & (meses < m0 + L)]:
+                pontos.append(G[s, m - m0 - 1] * (saldo + mes * S[s, m - m0 - 1]))
+            j = min(L, T - m0) - 1
+            saldo = G[s, j] * (saldo + mes * S[s, j])
+            if m0 + j + 1 in meses: pontos.append(saldo)
+        res[k] = np.percentile(np.vstack(pontos), [5, 50, 95], axis=1)
+
+    # Pré-fixado: trajetória única (sem incerteza de taxa)
+    r_pre = (1 + pre / 100) ** (1/12) - 1
+    g = (1 + r_pre) ** meses
+    res["Pré"] = np.tile(ini * g + (mes * (g - 1) / r_pre if r_pre else mes * meses), (3, 1))
+    return meses, res
+
+@instrumented_cache(st.cache_data, show_spinner=False, max_entries=64)
+def get_monte_carlo(version, _ds, ini, mes, anos, pct, fx, pre):
+    return simulate_paths(monthly_rates(_ds).to_numpy(), ini, mes, anos, pct, fx, pre)
+
+def rolling_backtest(taxas_m, ini, mes, anos, pct, fx, pre):
+    """
+    Saldo final do plano (aporte inicial + mensais por `anos`) para cada mês de início possível no histórico.
+    Usa produtos e somas acumuladas: com P[j] = Π(1 + r[..j]) e C[j] = Σ 1/P[..j], a janela [s, e]
+    termina em P[e] * (ini / P[s] + mes * (C[e] - C[s])), todas as janelas de uma vez em O(meses).
+    Retorna DataFrame indexado pelo mês de início com uma coluna por indexador.
+    """
+    T = anos * 12
+    M = len(taxas_m)
+    if T > M: return pd.DataFrame(columns=["CDI", "IPCA", "Pré"])
+    r = {
+        "CDI": taxas_m["Selic"].to_numpy() * pct / 100,
+        "IPCA": (1 + taxas_m["IPCA"].to_numpy()) * (1 + fx / 100) ** (1/12) - 1,
+        "Pré": np.full(M, (1 + pre / 100) ** (1/12) - 1),
+    }
+    res = {}
+    for k, rk in r.items():
+        P = np.r_[1.0, np.cumprod(1 + rk)]
+        C = np.r_[0.0, np.cumsum(1 / P[1:])]
+        res[k] = P[T:] * (ini / P[:M - T + 1] + mes * (C[T:] - C[:M - T + 1]))
+    return pd.DataFrame(res, index=taxas_m.index[:M - T + 1])
+
+@instrumented_cache(st.cache_data, show_spinner=False, max_entries=64)
+def get_backtest(version, _ds, ini, mes, anos, pct, fx, pre):
+    return rolling_backtest(monthly_rates(_ds), ini, mes, anos, pct, fx, pre)
+
+# IR regressivo sobre o rendimento, pelo prazo de cada aporte: até 180, 360 e 720 dias e acima (meses de 30 dias)
+IR_FAIXAS = [(6, 0.225), (12, 0.20), (24, 0.175), (np.inf, 0.15)]
+
+# Grade do modo comparativo: parâmetros de cada produto (linhas do mapa de calor) x prazos de 1 a 30 anos
+COMP_PARAMS = {
+    "CDI": ("% do CDI", np.arange(80, 151, 5)),
+    "IPCA": ("IPCA + % a.a.", np.arange(2, 9.01, 0.5)),
+    "Pré": ("Pré % a.a.", np.arange(6, 18.01, 0.5)),
+}
+COMP_ANOS = np.arange(1, 31)
+
+def aliquota_ir(meses):
+    return np.select([np.asarray(meses) <= m for m, _ in IR_FAIXAS[:-1]], [a for _, a in IR_FAIXAS[:-1]], IR_FAIXAS[-1][1])
+
+def plan_balances(taxas_aa, ini, mes, meses, ir=False):
+    """
+    Saldo do plano (aporte inicial + `mes` ao fim de cada mês) para cada taxa anual (%) x prazo em meses,
+    em forma fechada: com P[h] = (1 + r)^h e C[h] = Σ (P[i] - 1) para i < h, o saldo bruto após n meses é
+    ini * P[n] + mes * (C[n] + n). Com `ir`, desconta o IR de cada aporte pela sua faixa de prazo (o inicial
+    rende n meses, o do mês j rende n - j), somando os rendimentos de cada faixa por diferenças de C.
+    Retorna array len(taxas_aa) x len(meses).
+    """
+    r = (1 + np.atleast_1d(np.asarray(taxas_aa, dtype=np.float64)) / 100) ** (1/12) - 1
+    n = np.asarray(meses, dtype=np.int64)
+    P = (1 + r)[:, None] ** np.arange(n.max() + 1)
+    C = np.concatenate([np.zeros((len(r), 1)), np.cumsum(P - 1, axis=1)], axis=1)
+    saldo = ini * P[:, n] + mes * (C[:, n] + n)
+    if not ir: return saldo
+    imposto = aliquota_ir(n) * ini * (P[:, n] - 1)
+    lo = 0
+    for hi, a in IR_FAIXAS:
+        # Aportes mensais com prazo h em [lo, hi] (e h < n)
+        imposto = imposto + a * mes * (C[:, np.minimum(n, hi + 1).astype(np.int64)] - C[:, np.minimum(n, lo)])
+        lo = hi + 1
+    return saldo - imposto
+
+def taxa_anual(produto, param, selic, ipca):
+    """
+    Taxa anual (%) de um produto: `param` é o % do CDI, a taxa fixa do IPCA + ou a taxa pré.
+    """
+    param = np.asarray(param, dtype=np.float64)
+    if produto == "CDI": return selic * param / 100
+    if produto == "IPCA": return ((1 + ipca/100) * (1 + param/100) - 1) * 100
+    return param
+
+def comparison_grid(selic, ipca, ini, mes, ir=True):
+    """
+    Saldo final de cada produto para toda a grade de COMP_PARAMS x COMP_ANOS, sobre Selic e IPCA médios (% a.a.).
+    Retorna {produto: DataFrame parâmetro x anos}.
+    """
+    with timed("comparativo"):
+        return {k: pd.DataFrame(plan_balances(taxa_anual(k, v, selic, ipca), ini, mes, COMP_ANOS * 12, ir), index=v, columns=COMP_ANOS)
+                for k, (_, v) in COMP_PARAMS.items()}
+
+# ==============================================================================
+# EXPORTAÇÃO (XLSX, PARQUET E CSV)
+# ==============================================================================
+# Gerada no clique do download_button (numa thread à parte da renderização). O histórico completo fica
+# em disco, um arquivo por versão dos dados e formato; as projeções da calculadora são pequenas e vão em memória.
+
+EXPORT_DIR = os.path.join(DATA_DIR, "exports")
+# formato: (extensão de uma tabela, MIME); várias tabelas em CSV/Parquet vão num .zip, uma por arquivo
+EXPORT_FORMATOS = {
+    "XLSX": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "CSV": ("csv", "text/csv"),
+}
+EXPORT_LINHAS = 5000 # Linhas convertidas por vez ao escrever a planilha
+# EXPORT_DIR é compartilhado pelos processos do host: geração e limpeza sob flock, e só se apaga o que
+# ninguém usou nos últimos EXPORT_CARENCIA s (o uso renova a data do arquivo)
+EXPORT_LOCK_PATH = os.path.join(EXPORT_DIR, "export.lock")
+EXPORT_CARENCIA = 900
+_export_lock = threading.Lock()
+
+def export_ext(tabelas, formato):
+    """
+    (extensão, MIME) do arquivo exportado para estas tabelas.
+    """
+    if formato != "XLSX" and len(tabelas) > 1: return "zip", "application/zip"
+    return EXPORT_FORMATOS[formato]
+
+def _xlsx_linhas(df):
+    # Linhas da planilha em blocos: só EXPORT_LINHAS linhas convertidas para objetos Python de cada vez
+    indice = df.index.to_pydatetime() if isinstance(df.index, pd.DatetimeIndex) else df.index.to_numpy()
+    so_float = all(d.kind == "f" for d in df.dtypes)
+    for i in range(0, len(df), EXPORT_LINHAS):
+        bloco = df.iloc[i:i + EXPORT_LINHAS]
+        if so_float:
+            for idx, valores in zip(indice[i:i + EXPORT_LINHAS], bloco.to_numpy(np.float64).tolist()):
+                yield [idx] + [None if v != v else v for v in valores]
+        else:
+            # Colunas inteiras (ex.: Código SGS) continuam inteiras; faltantes viram célula vazia
+            for idx, valores in zip(indice[i:i + EXPORT_LINHAS], bloco.astype(object).where(bloco.notna(), None).to_numpy().tolist()):
+                yield [idx] + valores
+
+def write_export(tabelas, formato, destino):
+    """
+    Grava {nome: DataFrame numérico} em `destino` (caminho ou arquivo binário). XLSX: uma aba por tabela, com o
+    openpyxl em modo write_only (as linhas vão direto para o arquivo). CSV (; e vírgula decimal, como o Excel em
+    português abre) e Parquet: o próprio arquivo, ou um .zip com um arquivo por tabela.
+    """
+    if formato == "XLSX":
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        for nome, df in tabelas.items():
+            ws = wb.create_sheet(nome[:31])
+            ws.append([df.index.name or ""] + [str(c) for c in df.columns])
+            for linha in _xlsx_linhas(df): ws.append(linha)
+        wb.save(destino)
+        return
+    ext = EXPORT_FORMATOS[formato][0]
+    def _bytes(df):
+        if formato == "Parquet": return df.to_parquet()
+        return df.to_csv(sep=";", decimal=",", date_format="%Y-%m-%d").encode("utf-8-sig")
+    if len(tabelas) == 1:
+        dados = _bytes(next(iter(tabelas.values())))
+        if isinstance(destino, str):
+            with open(destino, "wb") as f: f.write(dados)
+        else: destino.write(dados)
+        return
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nome, df in tabelas.items(): zf.writestr(f"{nome}.{ext}", _bytes(df))
+
+def export_bytes(tabelas, formato):
+    buf = io.BytesIO()
+    write_export(tabelas, formato, buf)
+    return buf.getvalue()
+
+def history_tables(ds):
+    """
+    Tabelas do histórico completo: séries diárias e mensais como publicadas (mais os derivados, cada um na
+    frequência da sua origem), o fechamento mensal de todas e a descrição de cada coluna.
+    """
+    # float32 do snapshot -> float64 arredondado, para a planilha não mostrar 6.519999980926514 no lugar de 6.52
+    ds = {n: s.astype("float64").round(6) for n, s in ds.items()}
+    mensais = [n for n, s in ds.items() if len(s) and (s.index.day == 1).all()]
+    diarias = [n for n in ds if n not in mensais]
+    tab = {
+        "Diárias": pd.concat({n: ds[n] for n in diarias}, axis=1).sort_index(),
+        "Mensais": pd.concat({n: ds[n] for n in mensais}, axis=1).sort_index(),
+        "Fechamento mensal": pd.concat({n: s.resample('M').last() for n, s in ds.items()}, axis=1).sort_index(),
+    }
+    for df in tab.values(): df.index.name = "Data"
+    desc = pd.DataFrame({
+        "Código SGS": pd.array([SERIES[n]["codigo"] if n in SERIES else None for n in ds], dtype="Int64"),
+        "Observações": [len(ds[n]) for n in ds],
+    }, index=pd.Index([SERIES[n]["rotulo"] if n in SERIES else f"{n} (derivado)" for n in ds], name="Série"))
+    tab["Séries"] = desc
+    return tab
+
+def export_history(version, formato, ds):
+    """
+    Caminho do arquivo com o histórico completo para a versão dos dados e o formato. Gerado uma vez no host: quem
+    pede durante a geração (nesta ou em outra thread ou processo) espera e reaproveita o arquivo. Arquivos de
+    outras versões, e temporários abandonados, são apagados depois de EXPORT_CARENCIA s sem uso.
+    """
+    ext = export_ext([None, None], formato)[0]
+    prefixo = f"obinvest_historico_{version.replace(':', '').replace('-', '')[:15]}"
+    path = os.path.join(EXPORT_DIR, f"{prefixo}_{formato.lower()}.{ext}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    with _export_lock, open(EXPORT_LOCK_PATH, "a", encoding="utf-8") as trava:
+        if fcntl: fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            limite = time.time() - EXPORT_CARENCIA
+            for f in os.listdir(EXPORT_DIR):
+                f = os.path.join(EXPORT_DIR, f)
+                if f in (path, EXPORT_LOCK_PATH) or os.path.basename(f).startswith(prefixo): continue
+                try:
+                    if os.path.getmtime(f) < limite: os.remove(f)
+                except FileNotFoundError: pass
+            if os.path.exists(path):
+                os.utime(path) # Em uso: fora da limpeza pela carência
+                return path
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with timed("export", formato=formato): write_export(history_tables(ds), formato, tmp)
+            os.replace(tmp, path)
+        finally:
+            if fcntl: fcntl.flock(trava, fcntl.LOCK_UN)
+    METRICS.inc("obinvest_exports_total", kind="historico", formato=formato)
+    return path
+
+# ==============================================================================
+# ATUALIZAÇÃO EM SEGUNDO PLANO (STALE-WHILE-REVALIDATE)
+# ==============================================================================
+
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "snapshot.json")
+BRT = timezone(timedelta(hours=-3))
+# Horários (Brasília) logo após as publicações do BCB: Focus (seg. ~08:25), IPCA/IGP-M (~09:00),
+# PTAX de fechamento (~13:10) e carga do SGS no fim da tarde
+REFRESH_SLOTS = [(8, 40), (9, 15), (13, 30), (18, 30)]
+REFRESH_RETRY = 300 # Nova tentativa após falha (s)
+# Vários processos no mesmo host (atrás de um balanceador) compartilham DATA_DIR: um só busca, os outros
+# esperam na trava e reaproveitam o que ele gravou em disco
+REFRESH_LOCK_PATH = os.path.join(DATA_DIR, "refresh.lock")
+REFRESH_COALESCE = 120 # Tentativa de outro processo mais recente que isso (s) é reaproveitada (< REFRESH_RETRY)
+_refresh_lock = threading.Lock()
+FOCUS_LOCK_PATH = os.path.join(DATA_DIR, "focus.lock") # Um só processo alimenta o arquivo do Focus por vez
+
+def next_refresh(agora=None):
+    """
+    Próximo horário de atualização: slots de REFRESH_SLOTS em dias úteis.
+    """
+    agora = agora or datetime.now(BRT)
+    for dias in range(8):
+        dia = agora.date() + timedelta(days=dias)
+        if dia.weekday() >= 5: continue
+        for h, m in REFRESH_SLOTS:
+            slot = datetime(dia.year, dia.month, dia.day, h, m, tzinfo=BRT)
+            if slot > agora: return slot
+
+def fmt_idade(ts):
+    seg = (datetime.now() - ts).total_seconds()
+    if seg < 60: return "agora"
+    if seg < 3600: return f"há {int(seg // 60)} min"
+    if seg < 86400: return f"há {int(seg // 3600)} h"
+    return f"há {int(seg // 86400)} dia(s)"
+
+@contextmanager
+def refresh_lock():
+    """
+    Trava exclusiva do refresh entre as threads e os processos do host (flock em REFRESH_LOCK_PATH).
+    O próprio arquivo guarda o estado da última tentativa, {"tentativa", "ok", "pid"}: quem entra recebe
+    esse dicionário e o que alterar nele é gravado na saída. Sem fcntl (Windows), vale só dentro do processo.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(REFRESH_LOCK_PATH, "a+", encoding="utf-8") as f:
+        with timed("refresh_lock"):
+            if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+            else: _refresh_lock.acquire()
+        try:
+            f.seek(0)
+            try: estado = json.loads(f.read() or "{}")
+            except ValueError: estado = {}
+            yield estado
+            f.seek(0); f.truncate(); f.write(json.dumps(estado)); f.flush()
+        finally:
+            if fcntl: fcntl.flock(f, fcntl.LOCK_UN)
+            else: _refresh_lock.release()
+
+class DataRefresher:
+    """
+    Mantém o último snapshot bom (SGS + Focus) e o renova numa thread nos horários do BCB.
+    As páginas só leem `snapshot`, sem esperar pela rede; a troca é uma atribuição atômica.
+    """
+    def __init__(self):
+        self.snapshot = self._load_disk()
+        # Estado do arquivo do Focus: None até a carga inicial terminar (a página não desenha um arquivo pela metade)
+        try: self.focus_version = focus_state()
+        except (OSError, sqlite3.Error) as e:
+            log_error("focus_archive", e)
+            self.focus_version = None
+        self.ready = threading.Event()
+        if self.snapshot is not None: self.ready.set()
+        threading.Thread(target=self._run, name="obinvest-refresh", daemon=True).start()
+
+    def _load_disk(self):
+        # Histórico salvo por execuções anteriores: servido imediatamente, sem rede
+        ds = get_data(offline=True)
+        if not ds: return None
+        try:
+            with open(SNAPSHOT_PATH, encoding="utf-8") as f: meta = json.load(f)
+            fetched_at = datetime.fromisoformat(meta["fetched_at"])
+        except (OSError, ValueError, KeyError):
+            # Sem snapshot.json legível: a idade vem do manifesto e, sem ele, os dados contam como de agora
+            try: meta, fetched_at = {}, datetime.fromtimestamp(os.path.getmtime(MANIFEST_PATH))
+            except OSError: meta, fetched_at = {}, datetime.now()
+        return {"ds": freeze_dataset(ds), "focus": meta.get("focus", focus_vazio()), "fetched_at": fetched_at, "version": fetched_at.isoformat()}
+
+    def refresh(self):
+        """
+        Uma busca por vez no host: quem pega a trava logo depois de outro processo ter buscado (ou falhado)
+        reaproveita o snapshot que ele gravou em disco, sem ir ao BCB.
+        """
+        with refresh_lock() as estado:
+            try: idade = (datetime.now() - datetime.fromisoformat(estado["tentativa"])).total_seconds()
+            except (KeyError, ValueError): idade = None
+            if idade is not None and 0 <= idade < REFRESH_COALESCE: return self._reuse(estado)
+            ok = self._fetch()
+            estado.update(tentativa=datetime.now().isoformat(timespec="seconds"), ok=ok, pid=os.getpid())
+            return ok
+
+    def _reuse(self, estado):
+        METRICS.inc("obinvest_refresh_total", result="compartilhado" if estado.get("ok") else "adiado")
+        log_event("refresh", compartilhado=True, ok=bool(estado.get("ok")), pid=estado.get("pid"))
+        # Falha recente de outro processo: não insiste, tenta de novo no próximo ciclo
+        if not estado.get("ok"): return False
+        snap = self._load_disk()
+        if snap is None: return False
+        if self.snapshot is None or snap["fetched_at"] > self.snapshot["fetched_at"]:
+            self.snapshot = snap
+            METRICS.set("obinvest_snapshot_timestamp_seconds", snap["fetched_at"].timestamp())
+        return True
+
+    def _fetch(self):
+        old = self.snapshot
+        with timed("get_data"): ds = get_data(prev=None if old is None else old["ds"])
+        with timed("get_focus_data"): focus = get_focus_data()
+        METRICS.inc("obinvest_refresh_total", result="ok" if ds else "falha")
+        log_event("refresh", ok=bool(ds), focus=focus["Data_PIB"] != "-")
+        if not ds: return False
+        # Focus fora do ar: mantém a última projeção válida
+        if focus["Data_PIB"] == "-" and old is not None: focus = old["focus"]
+
+        fetched_at = datetime.now()
+        self.snapshot = {"ds": freeze_dataset(ds), "focus": focus, "fetched_at": fetched_at, "version": fetched_at.isoformat()}
+        METRICS.set("obinvest_snapshot_timestamp_seconds", fetched_at.timestamp())
+
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp = SNAPSHOT_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump({"fetched_at": fetched_at.isoformat(), "focus": focus}, f)
+        os.replace(tmp, SNAPSHOT_PATH)
+        return True
+
+    def _update_archive(self):
+        """
+        Alimenta o arquivo do Focus depois que o snapshot já foi publicado: a carga inicial (anos de
+        publicações) não atrasa a primeira página. Se outro processo já está gravando, só relê o estado.
+        """
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(FOCUS_LOCK_PATH, "a", encoding="utf-8") as trava:
+            try:
+                if fcntl: fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                pass
+            else:
+                try:
+                    with timed("focus_archive"): novas = update_focus_archive()
+                    METRICS.inc("obinvest_focus_archive_rows_total", novas)
+                finally:
+                    if fcntl: fcntl.flock(trava, fcntl.LOCK_UN)
+        self.focus_version = focus_state()
+
+    def _run(self):
+        while True:
+            ok = False
+            try: ok = self.refresh()
+            except Exception as e: log_error("refresh", e)
+            self.ready.set()
+            try: self._update_archive()
+            except Exception as e: log_error("focus_archive", e)
+            espera = (next_refresh() - datetime.now(BRT)).total_seconds()
+            time.sleep(max(1, espera if ok else min(espera, REFRESH_RETRY)))
+
+@st.cache_resource(show_spinner=False)
+def get_refresher():
+    return DataRefresher()
@@ -0,0 +1,33 @@
+"""
+Fixtures dos testes: o appy2.py executado uma vez (modo "bare" do Streamlit, sem servidor), ligado às respostas
+gravadas do BCB (bench/fixtures) e com uma pasta de dados temporária. `app` é o módulo obinvest (camada de
+dados importada pela página), onde os testes trocam constantes com monkeypatch.
+
+    python -m pytest -q
+"""
+import os
+import sys
+import warnings
+import importlib
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    import bcb_fixtures
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+    warnings.simplefilter("ignore", FutureWarning)
+    bcb_fixtures.install()
+    os.environ["OBINVEST_DATA_DIR"] = str(tmp_path_factory.mktemp("dados"))
+    os.environ.setdefault("OBINVEST_LOG_LEVEL", "WARNING")
+    importlib.import_module("appy2")
+    return importlib.import_module("obinvest")
+
+@pytest.fixture
+def snapshot(app):
+    return app.get_refresher().snapshot
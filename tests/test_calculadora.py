@@ -0,0 +1,10 @@
+import numpy as np
+
+def test_ipca_da_calculadora_e_a_variacao_mensal(snapshot, app):
+    ds = snapshot["ds"]
+    taxas = app.monthly_rates(ds)
+    mensal = ds["IPCA_Mensal"].astype("float64").resample("M").last().reindex(taxas.index) / 100
+    assert len(taxas) > 60
+    assert np.allclose(taxas["IPCA"], mensal)
+    selic = ds["Selic"].astype("float64").resample("M").mean().reindex(taxas.index)
+    assert np.allclose(taxas["Selic"], (1 + selic / 100) ** (1/12) - 1)
@@ -0,0 +1,26 @@
+import os
+import time
+
+def test_limpeza_respeita_a_carencia(app, snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "EXPORT_LOCK_PATH", str(tmp_path / "export.lock"))
+    recente, antigo = tmp_path / "obinvest_historico_20990101T0000_csv.zip", tmp_path / "obinvest_historico_20000101T0000_csv.zip"
+    recente.write_bytes(b"outro processo"); antigo.write_bytes(b"velho")
+    os.utime(antigo, (time.time() - 2 * app.EXPORT_CARENCIA,) * 2)
+    path = app.export_history(snapshot["version"], "CSV", snapshot["ds"])
+    assert os.path.exists(path) and recente.exists() and not antigo.exists()
+    os.utime(path, (time.time() - 2 * app.EXPORT_CARENCIA,) * 2)
+    assert app.export_history(snapshot["version"], "CSV", snapshot["ds"]) == path
+    assert os.path.getmtime(path) > time.time() - 60
+
+def test_codigo_sgs_sai_como_inteiro(app, snapshot):
+    import io, zipfile
+    from openpyxl import load_workbook
+    desc = app.history_tables(snapshot["ds"])["Séries"]
+    assert str(desc["Código SGS"].dtype) == "Int64"
+    with zipfile.ZipFile(io.BytesIO(app.export_bytes({"Séries": desc, "Outra": desc}, "CSV"))) as zf:
+        csv = zf.read("Séries.csv").decode("utf-8-sig")
+    assert ";432;" in csv and "432.0" not in csv and "432,0" not in csv
+    ws = load_workbook(io.BytesIO(app.export_bytes({"Séries": desc}, "XLSX")))["Séries"]
+    codigos = [c.value for c in ws["B"][1:]]
+    assert 432 in codigos and isinstance(codigos[0], int) and None in codigos
@@ -0,0 +1,26 @@
+import threading
+import socket
+
+def test_porta_de_metricas_ocupada_nao_derruba_a_pagina(app):
+    with socket.socket() as ocupado:
+        ocupado.bind(("127.0.0.1", 0))
+        ocupado.listen()
+        porta = ocupado.getsockname()[1]
+        antes = app.METRICS.counter_value("obinvest_errors_total", etapa="metrics_server")
+        assert app.start_metrics_server(porta) is None
+        assert app.METRICS.counter_value("obinvest_errors_total", etapa="metrics_server") == antes + 1
+
+def test_endpoint_so_responde_em_metrics(app):
+    import urllib.request, urllib.error
+    srv = app.ThreadingHTTPServer(("127.0.0.1", 0), app._MetricsHandler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+    try:
+        for caminho, status in [("/metrics", 200), ("/metrics?x=1", 200), ("/metricsfoo", 404), ("/", 404)]:
+            try: resp = urllib.request.urlopen(base + caminho, timeout=5)
+            except urllib.error.HTTPError as e: resp = e
+            corpo = resp.read()
+            assert resp.status == status, caminho
+            assert (corpo == b"Use /metrics\n") == (status == 404), caminho
+    finally:
+        srv.shutdown(); srv.server_close()
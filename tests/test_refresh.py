@@ -0,0 +1,47 @@
+from contextlib import closing
+from datetime import datetime
+import threading
+import time
+
+def _publicacao(app):
+    with closing(app.focus_db()) as con, con: con.execute("INSERT OR IGNORE INTO focus_anual VALUES ('IPCA', '2026', '2026-01-02', 4.0)")
+
+def test_snapshot_publicado_antes_do_arquivo_focus(app, tmp_path, monkeypatch):
+    liberado, visto = threading.Event(), []
+    def arquivo():
+        visto.append((r.ready.is_set(), r.snapshot is not None))
+        liberado.wait(30)
+        _publicacao(app)
+        return 1
+    monkeypatch.setattr(app, "FOCUS_DB_PATH", str(tmp_path / "focus.sqlite"))
+    monkeypatch.setattr(app, "update_focus_archive", arquivo)
+    monkeypatch.setattr(app, "REFRESH_COALESCE", 0)
+    monkeypatch.setattr(app.DataRefresher, "_load_disk", lambda self: None)
+    r = app.DataRefresher()
+    try:
+        assert r.ready.wait(30)
+        limite = time.monotonic() + 10
+        while not visto and time.monotonic() < limite: time.sleep(0.05)
+        assert visto == [(True, True)]
+        assert r.focus_version is None
+    finally:
+        liberado.set()
+    limite = time.monotonic() + 10
+    while r.focus_version is None and time.monotonic() < limite: time.sleep(0.05)
+    assert r.focus_version is not None
+
+def test_disco_sem_snapshot_nem_manifesto(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "SNAPSHOT_PATH", str(tmp_path / "snapshot.json"))
+    monkeypatch.setattr(app, "MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    (tmp_path / "snapshot.json").write_text("{corrompido")
+    snap = app.DataRefresher._load_disk(None)
+    assert snap is not None and snap["focus"] == app.focus_vazio()
+    assert abs((snap["fetched_at"] - datetime.now()).total_seconds()) < 60
+
+def test_arquivo_focus_em_disco_pronto_na_partida(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "FOCUS_DB_PATH", str(tmp_path / "focus.sqlite"))
+    monkeypatch.setattr(app.DataRefresher, "_run", lambda self: None)
+    monkeypatch.setattr(app.DataRefresher, "_load_disk", lambda self: None)
+    assert app.DataRefresher().focus_version is None
+    _publicacao(app)
+    assert app.DataRefresher().focus_version == ("2026-01-02", 1)
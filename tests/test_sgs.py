@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+
+import httpx
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def cliente_bcb(app):
+    """
+    Troca o cliente HTTP do python-bcb por um MockTransport com o handler dado; devolve a lista de requisições.
+    """
+    import bcb.http
+    original = bcb.http._CLIENT
+    requisicoes = []
+    def instala(handler):
+        def registra(request):
+            requisicoes.append(time.monotonic())
+            return handler(request, len(requisicoes))
+        bcb.http._CLIENT = httpx.Client(transport=httpx.MockTransport(registra))
+        return requisicoes
+    yield instala
+    bcb.http._CLIENT = original
+
+def test_janela_igual_ao_python_bcb(app):
+    from bcb import sgs
+    ini, fim = pd.Timestamp("2020-01-01"), pd.Timestamp("2021-06-30")
+    s = app._fetch_sgs_range(432, ini, fim)
+    ref = sgs.get(432, start="2020-01-01", end="2021-06-30").iloc[:, 0]
+    assert s.to_numpy().tolist() == ref.to_numpy().tolist()
+    assert s.index.equals(pd.DatetimeIndex(ref.index))
+
+def test_uma_camada_de_retentativa(app, cliente_bcb, monkeypatch):
+    monkeypatch.setattr(app, "SGS_BACKOFF", 0.01)
+    def recusa(request, n): raise httpx.ConnectError("recusada", request=request)
+    requisicoes = cliente_bcb(recusa)
+    with pytest.raises(httpx.ConnectError):
+        app._fetch_sgs_range(432, pd.Timestamp("2024-01-01"), None)
+    assert len(requisicoes) == app.SGS_RETRIES
+
+def test_4xx_nao_e_refeito(app, cliente_bcb):
+    requisicoes = cliente_bcb(lambda request, n: httpx.Response(404, json={"erro": {"detail": "Série inexistente"}}))
+    with pytest.raises(httpx.HTTPStatusError):
+        app._fetch_sgs_range(999999, pd.Timestamp("2024-01-01"), None)
+    assert len(requisicoes) == 1
+
+def test_429_respeita_retry_after(app, cliente_bcb, monkeypatch):
+    monkeypatch.setattr(app, "SGS_BACKOFF", 0.01)
+    def limita(request, n):
+        if n == 1: return httpx.Response(429, headers={"Retry-After": "1"})
+        return httpx.Response(200, json=[{"data": "02/01/2024", "valor": "11.75"}])
+    requisicoes = cliente_bcb(limita)
+    s = app._fetch_sgs_range(432, pd.Timestamp("2024-01-01"), None)
+    assert s.tolist() == [11.75]
+    assert len(requisicoes) == 2 and requisicoes[1] - requisicoes[0] >= 1.0
+    # As outras threads também esperam o Retry-After
+    assert app._sgs_pausa["ate"] >= requisicoes[0] + 1.0
+
+def test_429_com_espera_longa_desiste(app, cliente_bcb):
+    requisicoes = cliente_bcb(lambda request, n: httpx.Response(429, headers={"Retry-After": "3600"}))
+    with pytest.raises(httpx.HTTPStatusError):
+        app._fetch_sgs_range(432, pd.Timestamp("2024-01-01"), None)
+    assert len(requisicoes) == 1
+
+@pytest.fixture
+def travado(cliente_bcb):
+    """
+    BCB que aceita a conexão e não responde (até o fim do teste).
+    """
+    solta = threading.Event()
+    def trava(request, n):
+        solta.wait(30)
+        return httpx.Response(503)
+    yield cliente_bcb(trava)
+    solta.set()
+
+def test_prazo_total_da_janela_com_bcb_travado(app, travado, monkeypatch):
+    monkeypatch.setattr(app, "SGS_PRAZO", 1.0)
+    monkeypatch.setattr(app, "BCB_PRAZO", 0.6)
+    monkeypatch.setattr(app, "SGS_BACKOFF", 0.01)
+    t = time.monotonic()
+    with pytest.raises(httpx.TimeoutException):
+        app._fetch_sgs_range(432, pd.Timestamp("2024-01-01"), None)
+    dt = time.monotonic() - t
+    # Duas tentativas (0,6 s e o que sobrou do prazo) e nenhuma espera além de SGS_PRAZO
+    assert 0.9 <= dt < 1.3
+    assert len(travado) >= 2
+
+def test_prazo_por_requisicao_com_bcb_travado(app, travado, monkeypatch):
+    monkeypatch.setattr(app, "BCB_PRAZO", 0.5)
+    t = time.monotonic()
+    with pytest.raises(httpx.TimeoutException):
+        app.bcb_client().get("https://olinda.bcb.gov.br/olinda/servico/Expectativas/versao/v1/odata/")
+    assert time.monotonic() - t < 0.8
+
+def test_falha_sob_demanda_nao_fica_no_cache(app, cliente_bcb, monkeypatch):
+    import bcb.http
+    original = bcb.http._CLIENT
+    cliente_bcb(lambda request, n: httpx.Response(503))
+    monkeypatch.setattr(app, "SGS_BACKOFF", 0.01)
+    with pytest.raises(RuntimeError):
+        app.get_series("INPC", "teste-falha")
+    bcb.http._CLIENT = original
+    s = app.get_series("INPC", "teste-falha")
+    assert not s.empty and s.name == "INPC"
+
+def test_busca_sob_demanda_refeita_depois_da_falha(app, cliente_bcb, monkeypatch):
+    import bcb.http
+    original = bcb.http._CLIENT
+    cliente_bcb(lambda request, n: httpx.Response(503))
+    monkeypatch.setattr(app, "SGS_BACKOFF", 0.01)
+    job = app.request_series("IPCA_Alimentacao", "teste-job")
+    assert isinstance(job.exception(timeout=10), RuntimeError)
+    assert app.request_series("IPCA_Alimentacao", "teste-job") is job
+    bcb.http._CLIENT = original
+    monkeypatch.setattr(app, "SERIES_FALHA_TTL", 0)
+    novo = app.request_series("IPCA_Alimentacao", "teste-job")
+    assert novo is not job and not novo.result(timeout=10).empty
+
+def test_gravacoes_concorrentes_mantem_o_manifesto(app):
+    from concurrent.futures import ThreadPoolExecutor
+    idx = pd.date_range("2024-01-01", periods=12, freq="MS")
+    codigos = range(900001, 900017)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda c: app.save_series(c, pd.Series(float(c), index=idx)), codigos))
+    manifest = app.load_manifest()
+    assert all(str(c) in manifest for c in codigos)
+    assert all(app.load_series(c).eq(float(c)).all() for c in codigos)
+    assert not [f for f in os.listdir(app.SGS_DIR) if f.endswith(".tmp")]
+
+def test_falha_do_sgs_vai_para_o_log_e_metricas(app, cliente_bcb, monkeypatch, caplog):
+    import json, logging
+    monkeypatch.setattr(app, "SGS_BACKOFF", 0.01)
+    cliente_bcb(lambda request, n: httpx.Response(404, json={"erro": {"detail": "Série inexistente"}}))
+    antes = app.METRICS.counter_value("obinvest_errors_total", etapa="sgs")
+    with caplog.at_level(logging.ERROR, logger="obinvest"):
+        assert app.update_series([999998], pd.Timestamp("2024-01-01")) == {}
+    assert app.METRICS.counter_value("obinvest_errors_total", etapa="sgs") == antes + 1
+    evento = json.loads(caplog.records[-1].getMessage())
+    assert evento["evento"] == "erro" and evento["etapa"] == "sgs" and evento["codigo"] == 999998
+
+def test_delta_traz_revisoes_das_ultimas_observacoes(app, cliente_bcb):
+    from urllib.parse import parse_qs
+    codigo = 900100
+    idx = pd.date_range(pd.Timestamp.today().normalize() - pd.DateOffset(years=2), periods=24, freq="MS")
+    app.save_series(codigo, pd.Series(1.0, index=idx))
+    pedidos = []
+    def revisado(request, n):
+        ini = pd.to_datetime(parse_qs(request.url.query.decode())["dataInicial"][0], format="%d/%m/%Y")
+        pedidos.append(ini)
+        return httpx.Response(200, json=[{"data": d.strftime("%d/%m/%Y"), "valor": "2.0"} for d in idx if d >= ini])
+    cliente_bcb(revisado)
+    s = app.update_series([codigo], idx[0])[codigo]
+    assert pedidos == [idx[-4]]
+    assert s.iloc[-4:].eq(2.0).all() and s.iloc[:-4].eq(1.0).all()
+    assert app.load_series(codigo).equals(s)
+
+def test_sob_demanda_reaproveita_busca_de_outro_processo(app, cliente_bcb, monkeypatch):
+    monkeypatch.setattr(app, "SGS_BACKOFF", 0.01)
+    from datetime import datetime, timedelta
+    codigo = app.SERIES["DLSP_PIB"]["codigo"]
+    idx = pd.date_range(pd.Timestamp.today().normalize() - pd.DateOffset(years=app.HIST_ANOS), periods=12 * app.HIST_ANOS, freq="MS")
+    app.save_series(codigo, pd.Series(50.0, index=idx)) # Gravada por outro processo depois do snapshot
+    requisicoes = cliente_bcb(lambda request, n: httpx.Response(503))
+    versao = (datetime.now() - timedelta(minutes=5)).isoformat()
+    s = app.get_series("DLSP_PIB", versao)
+    assert requisicoes == [] and s.eq(50.0).all()
+    assert os.path.exists(os.path.join(app.SGS_DIR, f"{codigo}.lock"))
+    # Versão dos dados mais nova que a última verificação: vai ao SGS (e, com ele fora, fica com o disco)
+    s = app.get_series("DLSP_PIB", (datetime.now() + timedelta(minutes=5)).isoformat())
+    assert requisicoes and s.eq(50.0).all()
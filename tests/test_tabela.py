@@ -0,0 +1,13 @@
+import pandas as pd
+
+def test_tabela_mensal_sem_nan(app, snapshot):
+    show, css = app.get_monthly_table(snapshot["version"], snapshot["ds"])
+    assert len(show) > 100
+    assert not show.apply(lambda c: c.str.contains("nan")).any().any()
+    assert show.index.equals(css.index)
+
+def test_tabela_mensal_comeca_no_mes_corrente(app, snapshot):
+    show, _ = app.get_monthly_table(snapshot["version"], snapshot["ds"])
+    # Mês corrente sem IPCA/IGP-M divulgados: repete o último valor, sem variação
+    assert show.index[0] == pd.Timestamp.today().normalize() + pd.offsets.MonthEnd(0)
+    assert show["IPCA"].iloc[0].endswith("=")